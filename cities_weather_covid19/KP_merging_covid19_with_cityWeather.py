@@ -1,23 +1,53 @@
-import requests
 import pandas as pd
 import numpy as np
 import os
-import logging
-from sqlalchemy import create_engine
 from dotenv import load_dotenv
+
+import sys
+# Shared helpers live in project/utils
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "project"))
+from utils.rate_limiter import shared_limiter
+from utils.http_client import http_get
+from utils.dataset_mirror import shared_mirror
+from utils.covid_loader import covid_frame, COVID_COLUMNS
+from utils.schema import WEATHER_SCHEMA, apply_schema
+from utils.weather_cache import shared_cache, url_namespace, city_key
+from utils.hedging import shared_policy, hedged_call
+from utils.etl_logging import get_logger, ProgressLogger
+from utils.stage_dag import Stage, run_stages
+from utils.pg_loader import load_to_postgres
+from utils.sqlite_loader import upsert_to_sqlite
+from concurrent.futures import ThreadPoolExecutor
+
 load_dotenv()
 
-# Configure the logging module to track errors, warnings, and information messages throughout the ETL process.
-# logging.basicConfig(
-#     level=logging.DEBUG,  # Set the minimum logging level
-#     format='%(asctime)s - %(levelname)s - %(message)s',  # Define the log message format
-#     filename="./w9/mmdt_etl.log"
-# )
+# Point this at a local stand-in (project/utils/openweather_stub.py) to test without the real API
+WEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+
+# One limiter shared by every OpenWeather call in this run
+weather_limiter = shared_limiter("openweather")
+# Responses are reused across runs until they are older than WEATHER_CACHE_TTL; answers
+# from a stand-in are cached apart from real ones
+weather_cache = shared_cache("openweather", url_namespace(WEATHER_BASE_URL))
+# Times every weather lookup and, with WEATHER_HEDGE=1, backs up the slowest ones
+weather_hedge = shared_policy("openweather")
+
+# Tracks errors, warnings, and information messages throughout the ETL process.
+# Records go through a queue to the console (LOG_LEVEL) and a rotating file (LOG_FILE, LOG_FILE_LEVEL).
+logger = get_logger("weather")
 
 # Fetches JSON from a given URL.
-def extract_json_from_url(url:str):
+def extract_json_from_url(url:str, limiter=None):
+    try:
+        return http_get(url, limiter=limiter).json()
+    except Exception as e:
+        raise ConnectionError(f"Can't extract data : {e}")
+
+# Reads a large dataset through the local mirror.
+# Downloads only when the remote copy changed and resumes interrupted transfers.
+def extract_json_from_mirror(url:str):
     try:
-        return requests.get(url).json()
+        return shared_mirror().load_json(url)
     except Exception as e:
         raise ConnectionError(f"Can't extract data : {e}")
 
@@ -25,27 +55,9 @@ def extract_json_from_url(url:str):
 # Iterates over all country codes, extracts relevant fields, drops empty columns, and creates a Pandas DataFrame.
 def get_covid_data() -> pd.DataFrame:
     covid_url = "https://raw.githubusercontent.com/owid/covid-19-data/refs/heads/master/public/data/latest/owid-covid-latest.json"
-    covid_json = extract_json_from_url(covid_url)
-    df_lst = []
-    for country_short_code in covid_json.keys():
-        single_country_df = pd.json_normalize(covid_json[country_short_code])
-        single_country_df['iso_country_code'] = country_short_code
-        # single_country_df.dropna(how="all", axis=1, inplace=True) ## performance is being slow
-        df_lst.append(single_country_df)
-        
-    all_countries_df = pd.concat(df_lst, ignore_index=True)
-    # drop all blank columns
-    all_countries_df.replace(r"^\s*$", np.nan, regex=True, inplace=True)
-    all_countries_df.dropna(how='all', axis=1, inplace=True)
-    print(all_countries_df.shape)
-    
-    ## Select only required columns (first 10)
-    selected_cols = [
-        "iso_country_code", "continent", "location", "last_updated_date",
-        "total_cases", "new_cases", "total_deaths", "new_deaths",
-        "total_cases_per_million", "total_deaths_per_million", "hosp_patients"
-    ]
-    selected_df = all_countries_df[selected_cols]
+    covid_json = extract_json_from_mirror(covid_url)
+    # One pass per selected column straight from the JSON; blanks become NaN and each column gets its declared dtype
+    selected_df = covid_frame(covid_json, COVID_COLUMNS)
     
     return selected_df
 
@@ -55,7 +67,7 @@ def get_cities_data() -> pd.DataFrame:
     required_data = []
     cities_url = "https://raw.githubusercontent.com/dr5hn/countries-states-cities-database/refs/heads/master/json/countries%2Bcities.json"
     
-    cities_json = extract_json_from_url(cities_url)
+    cities_json = extract_json_from_mirror(cities_url)
     # print(type(cities_json)) ## Assume it'll be list
     for country in cities_json:
         data_dict = {
@@ -68,7 +80,7 @@ def get_cities_data() -> pd.DataFrame:
             ## ideas - get all cities of countries then make more requests for Weather
         }
         # Logs information for debugging.
-        logging.info(f"Received data for {data_dict['country_name']} - {data_dict['country_capital']}")
+        logger.debug("Received data for %s - %s", data_dict['country_name'], data_dict['country_capital'])
         required_data.append(data_dict)
     required_df = pd.DataFrame(required_data)
     return required_df
@@ -78,9 +90,9 @@ def get_cities_data() -> pd.DataFrame:
 #  Extract Weather condition, Temperature min/max and City name.
 def get_city_weather(city_name:str) -> dict:
     api_key = os.getenv("WEATHER_KEY")
-    weather_api = f"https://api.openweathermap.org/data/2.5/weather?q={city_name}&appid={api_key}&units=metric"
+    weather_api = f"{WEATHER_BASE_URL}/weather?q={city_name}&appid={api_key}&units=metric"
     try:
-        weather_json = extract_json_from_url(weather_api)
+        weather_json = weather_cache.get_or_fetch(city_key(city_name), lambda: extract_json_from_url(weather_api, weather_limiter))
         required_dict = {
             "condition": weather_json['weather'][0].get('description', "Unknown weather"),
             "temperature_min": weather_json['main'].get('temp_min', np.nan),
@@ -89,55 +101,67 @@ def get_city_weather(city_name:str) -> dict:
         required_dict['city'] = city_name
         return required_dict
     except ConnectionError:
-        logging.debug(f"Can't get data from this city : {city_name}")
+        logger.debug("Can't get data from this city : %s", city_name)
         return None
     except Exception as e:
-        logging.info(f"Other error - {e}")
+        logger.warning("Other error - %s", e)
         return None
 
 # Fetches weather data for all capital cities.
 # Returns a DataFrame containing weather information.
 def get_all_cities_weather(city_names_lst: list) -> pd.DataFrame:
     all_data = []
-    for city_name in city_names_lst:
-        if city_dict := get_city_weather(city_name):
-            all_data.append(city_dict)
-        else:
-            logging.info(f"This city {city_name} is being none!")
-    all_city_df = pd.DataFrame(all_data)
+    progress = ProgressLogger(logger, len(city_names_lst), "Weather")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for city_name in city_names_lst:
+            if city_dict := hedged_call(weather_hedge, executor, get_city_weather, city_name):
+                all_data.append(city_dict)
+            else:
+                logger.debug("This city %s is being none!", city_name)
+            progress.update(failed=city_dict is None)
+    progress.close()
+    logger.info("Per-city latency: %s", weather_hedge.stats())
+    all_city_df = apply_schema(pd.DataFrame(all_data), WEATHER_SCHEMA)
     return all_city_df
 
-# Merges city, weather, and COVID data into a single DataFrame.
-# Joins city data with weather data on the country_capital field.
-# Joins the result with COVID-19 data on iso_country_code.
-# Returns the final DataFrame.
-def transform_data():
-    print("\nStarting data transformation ...")
-    
-    # Fetch cities data
+# Fetches cities data and removes NaN values from 'country_capital' before making API requests.
+def get_capital_cities() -> pd.DataFrame:
     city_df = get_cities_data()
+    return city_df.dropna(subset=['country_capital'])
 
-    # Remove NaN values from 'country_capital' before making API requests
-    city_df = city_df.dropna(subset=['country_capital'])
-    
-    # Fetch weather data only for valid capital cities
+# Fetches weather data only for valid capital cities.
+def get_capitals_weather(city_df: pd.DataFrame) -> pd.DataFrame:
     capital_names = city_df['country_capital'].astype(str).to_list()
-    weather_df = get_all_cities_weather(capital_names)
+    return get_all_cities_weather(capital_names)
 
-    # Merge cities with weather data
+# Joins city data with weather data on the country_capital field.
+# Joins the result with COVID-19 data on iso_country_code.
+def merge_data(city_df: pd.DataFrame, weather_df: pd.DataFrame, covid_df: pd.DataFrame) -> pd.DataFrame:
     # city_df["country_capital"] is matched with weather_df["city"]
     city_weather_df = city_df.merge(weather_df, how="inner", left_on='country_capital', right_on='city')
 
-    # Fetch COVID-19 data
-    covid_df = get_covid_data()
-
     # Ensure correct data types before merging
     covid_df["iso_country_code"] = covid_df["iso_country_code"].astype(str)
     city_weather_df["country_iso3"] = city_weather_df["country_iso3"].astype(str)
 
     # Merge COVID-19 data with city weather data
-    covid_city_weather_df = covid_df.merge(city_weather_df, how="left", left_on="iso_country_code", right_on="country_iso3")
-    
+    return covid_df.merge(city_weather_df, how="left", left_on="iso_country_code", right_on="country_iso3")
+
+# Merges city, weather, and COVID data into a single DataFrame.
+# The COVID-19 download does not depend on the cities, so it runs while the cities and
+# their weather are fetched; the merge waits for both.
+# Returns the final DataFrame.
+def transform_data():
+    print("\nStarting data transformation ...")
+
+    values = run_stages([
+        Stage("cities", get_capital_cities, outputs=("city_df",)),
+        Stage("weather", get_capitals_weather, ("city_df",), ("weather_df",)),
+        Stage("covid", get_covid_data, outputs=("covid_df",)),
+        Stage("merge", merge_data, ("city_df", "weather_df", "covid_df"), ("covid_city_weather_df",)),
+    ])
+    covid_city_weather_df = values["covid_city_weather_df"]
+
     print(f"Data transformation completed. Final shape: {covid_city_weather_df.shape}")
     
     return covid_city_weather_df
@@ -145,10 +169,13 @@ def transform_data():
     
 
 # Saves the final DataFrame into an SQLite database named w9_demo.db.
-# Saves the table as covid_city_demo
+# Saves the table as covid_city_demo, upserting on (iso_country_code, city) so reruns only write changed rows
+# With POSTGRES_DSN set, bulk loads the table into Postgres with COPY instead.
 def load_data(df:pd.DataFrame):
-    engine = create_engine('sqlite:///w9_demo.db')
-    df.to_sql("covid_city_demo", engine, if_exists="replace")
+    if os.getenv("POSTGRES_DSN"):
+        load_to_postgres(df, "covid_city_demo")
+        return
+    upsert_to_sqlite(df, "w9_demo.db", "covid_city_demo", index_columns=("country_iso3", "country_capital"))
     print("Successfully loaded into sqlite db!")
 
 # Running the ETL Process
@@ -156,4 +183,5 @@ if __name__ == "__main__":
     df = transform_data()
     # Prints the shape (rows, columns) of the final DataFrame
     print(df.shape)
-    load_data(df)
\ No newline at end of file
+    load_data(df)
+    print(f"Weather cache: {weather_cache.stats()}")
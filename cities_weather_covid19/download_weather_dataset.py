@@ -1,17 +1,33 @@
 import os
+import sys
 import json
-import time
 import requests
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+# Shared helpers live in project/utils
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "project"))
+from utils.rate_limiter import shared_limiter
+from utils.http_client import http_get
+from utils.checkpoint import HarvestJournal
+from utils.etl_logging import get_logger, ProgressLogger
+
 # Load API key from .env
 load_dotenv()
 API_KEY = os.getenv("WEATHER_KEY")
 if not API_KEY:
     raise ValueError("API key not found in .env file")
 
+# Point this at a local stand-in (project/utils/openweather_stub.py) to test without the real API
+WEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+
+# Adapts request rate and concurrency to the provider's quota (429 / Retry-After) and latency
+weather_limiter = shared_limiter("openweather")
+# Per-city messages are queued to the log; the console gets a progress summary every few seconds
+logger = get_logger("weather")
+
 # Load city names from countries_cities.json
 with open("countries_cities.json", "r", encoding="utf-8") as file:
     countries_data = json.load(file)
@@ -21,15 +37,17 @@ city_names = []
 for country in countries_data:
     city_names.extend(country.get("cities", []))  # Add all cities from each country
 
-# Remove duplicates and limit requests (API rate limit consideration)
-city_names = list(set(city_names))  # Remove duplicates
-city_names = city_names[:100]  # Limit to first 100 cities (adjust as needed)
+# Remove duplicates and optionally limit requests (set MAX_CITIES in .env, 0 means all)
+city_names = list(dict.fromkeys(city_names))  # Remove duplicates, keeping a stable order so reruns can resume
+max_cities = int(os.getenv("MAX_CITIES", "100"))
+if max_cities:
+    city_names = city_names[:max_cities]
 
 # Function to fetch weather data
 def get_weather(city):
-    url = f"https://api.openweathermap.org/data/2.5/weather?q={city}&appid={API_KEY}&units=metric"
+    url = f"{WEATHER_BASE_URL}/weather?q={city}&appid={API_KEY}&units=metric"
     try:
-        response = requests.get(url, timeout=10)
+        response = http_get(url, limiter=weather_limiter, timeout=10)
         weather_json = response.json()
 
         if response.status_code == 200:
@@ -43,20 +61,37 @@ def get_weather(city):
             weather_json["city"] = city  # Add city name
             return weather_json  # Return the entire response
         else:
-            print(f"Error fetching {city}: {weather_json}")
+            logger.debug("Error fetching %s: %s", city, weather_json)
             return None
     except requests.exceptions.RequestException as e:
-        print(f"Request failed for {city}: {e}")
+        logger.warning("Request failed for %s: %s", city, e)
         return None
 
-# Fetch weather for each city
-weather_data = []
-for idx, city in enumerate(city_names):
-    print(f"Fetching weather for {city} ({idx+1}/{len(city_names)})")
+# Every city fetched is journaled, so an interrupted run picks up where it stopped; failed
+# cities are left out and tried again on the next run
+journal_path = os.getenv("WEATHER_JOURNAL", "weather_harvest.jsonl")
+journal = HarvestJournal(journal_path)
+remaining = [city for city in city_names if city not in journal]
+if journal.resumed:
+    print(f"Resuming from {journal_path}: {len(city_names) - len(remaining)} cities already done, {len(remaining)} to go")
+
+# Fetch weather for each city; the limiter decides how fast and how many at once
+progress = ProgressLogger(logger, len(remaining), "Weather")
+
+def fetch_city(city):
     weather = get_weather(city)
     if weather:
-        weather_data.append(weather)
-    time.sleep(1)  # Avoid API rate limits
+        journal.record(city, 'city', weather)
+    progress.update(failed=weather is None)
+    return weather
+
+with ThreadPoolExecutor(max_workers=weather_limiter.max_concurrency) as executor:
+    list(executor.map(fetch_city, remaining))
+progress.close()
+
+print(f"Rate limiter: {weather_limiter.stats()}")
+
+weather_data = [journal.get(city)[1] for city in city_names if city in journal]
 
 # Save structured weather data to JSON
 with open("weather_data.json", "w", encoding="utf-8") as outfile:
@@ -66,4 +101,6 @@ with open("weather_data.json", "w", encoding="utf-8") as outfile:
 # df = pd.DataFrame(weather_data)
 # df.to_csv("weather_data.csv", index=False)
 
+journal.complete()
+
 print("Weather data saved as 'weather_data.json' and 'weather_data.csv'")
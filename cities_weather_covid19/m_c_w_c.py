@@ -27,12 +27,35 @@ import numpy as np
 import logging
 import os
 
-from sqlalchemy import create_engine
 from dotenv import load_dotenv
 
+import sys
+# Shared helpers live in project/utils
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "project"))
+from utils.rate_limiter import shared_limiter
+from utils.http_client import http_get
+from utils.dataset_mirror import shared_mirror
+from utils.covid_loader import covid_frame, COVID_COLUMNS
+from utils.schema import WEATHER_SCHEMA, apply_schema
+from utils.weather_cache import shared_cache, url_namespace, city_key
+from utils.etl_logging import get_logger, ProgressLogger
+from utils.pg_loader import load_to_postgres
+from utils.sqlite_loader import upsert_to_sqlite
+
 # Load environment variables (API keys)
 load_dotenv()
 
+# Point this at a local stand-in (project/utils/openweather_stub.py) to test without the real API
+WEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+
+# One limiter shared by every OpenWeather call in this run
+weather_limiter = shared_limiter("openweather")
+# Responses are reused across runs until they are older than WEATHER_CACHE_TTL; answers
+# from a stand-in are cached apart from real ones
+weather_cache = shared_cache("openweather", url_namespace(WEATHER_BASE_URL))
+# Queued log output: the fetch loop never waits on the console or the log file
+logger = get_logger("weather")
+
 # Utility function to print DataFrame details
 def print_df(df: pd.DataFrame):
     print(df.shape)  # Print number of rows and columns
@@ -40,19 +63,28 @@ def print_df(df: pd.DataFrame):
     print(df.head())  # Print first 5 rows
 
 # Function to fetch JSON data from a URL
-def extract_json_from_url(url: str) -> dict:
+def extract_json_from_url(url: str, limiter=None) -> dict:
     try:
-        response = requests.get(url)
+        response = http_get(url, limiter=limiter)
         response.raise_for_status()  # Raise an error if request fails
         return response.json()  # Return JSON response
     except requests.exceptions.RequestException as e:
         print(f"Failed to fetch {url}: {e}")
         return {}
 
+# Function to read a large dataset through the local mirror
+# Downloads only when the remote copy changed and resumes interrupted transfers
+def extract_json_from_mirror(url: str) -> dict:
+    try:
+        return shared_mirror().load_json(url)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Failed to fetch {url}: {e}")
+        return {}
+
 # Extract COVID-19 data from OWID
 def extract_covid_data():
     covid_url = "https://raw.githubusercontent.com/owid/covid-19-data/refs/heads/master/public/data/latest/owid-covid-latest.json"
-    covid_json = extract_json_from_url(covid_url)
+    covid_json = extract_json_from_mirror(covid_url)
 
 # covid_json = {
 #     "AFG": {"continent": "Asia", "location": "Afghanistan", "total_cases": 235214},
@@ -63,64 +95,15 @@ def extract_covid_data():
         print("Error: Failed to retrieve COVID data.")
         return pd.DataFrame()
 
-    country_dfs_lst = []
-    for country_code, country_data in covid_json.items():
-        if isinstance(country_data, dict):  # Ensure it's valid JSON(dictionary)
-            
-            # Converts the nested dictionary into a flat DataFrame.
-            single_country_df = pd.json_normalize(country_data)
-
-                # single_country_df = {
-                #     "continent": "Asia",
-                #     "location": "Afghanistan",
-                #     "last_updated_date": "2024-08-04",
-                #     "total_cases": 235214,
-                #     "new_cases": 0
-                # }
-
-            # Adding iso_country_code (e.g., "AFG", "USA").
-            single_country_df['iso_country_code'] = country_code
-
-
-            country_dfs_lst.append(single_country_df)
-                # country_dfs_lst = [   {
-                #     "continent": "Asia",
-                #     "location": "Afghanistan",
-                #     "last_updated_date": "2024-08-04",
-                #     "total_cases": 235214,
-                #     "new_cases": 0
-                #   }
-                # ]
-
-    if not country_dfs_lst:
+    # Build the frame one selected column at a time straight from the JSON.
+    # Non-dict entries are skipped, blank cells become NaN and every column gets its
+    # declared dtype (nullable Int64 counts, float64 rates, categorical continent/location).
+    select_df = covid_frame(covid_json, COVID_COLUMNS)
+
+    if select_df.empty:
         print("Error: No COVID-19 data collected.")
         return pd.DataFrame()
 
-        
-
-# Since country_dfs_lst is a list of multiple DataFrames, calling pd.concat() merges them into a single DataFrame.
-# If we don’t use ignore_index=True, the original index from each country’s DataFrame is kept:
-    all_df = pd.concat(country_dfs_lst, ignore_index=True) 
-
-# following is if we use ignore_index=True
-#       continent     location last_updated_date  total_cases  new_cases
-# 0      Asia  Afghanistan        2024-08-04      235214          0
-# 1      Asia      Myanmar        2024-02-14      500000        100
-
-
-# Selecting Relevant Columns
-    select_cols = [
-        "iso_country_code", "continent", "location", "last_updated_date",
-        "total_cases", "new_cases", "total_deaths", "new_deaths",
-        "total_cases_per_million", "total_deaths_per_million", "hosp_patients"
-    ]
-
-
-    select_cols = [col for col in select_cols if col in all_df.columns]
-    select_df = all_df[select_cols]
-
-    select_df = select_df.replace(r"^\s*$", np.nan, regex=True)
-
     # The function returns a Pandas DataFrame containing the cleaned COVID-19 data.
     return select_df
     # iso_country_code	continent	location	last_updated_date	total_cases	new_cases	total_deaths	new_deaths
@@ -135,7 +118,7 @@ def extract_city_data():
     # city_url = "https://raw.githubusercontent.com/dr5hn/countries-states-cities-database/refs/heads/master/json/countries%2Bcities.json"
     city_url = "https://raw.githubusercontent.com/dr5hn/countries-states-cities-database/master/json/countries%2Bcities.json" 
     
-    city_lst_json = extract_json_from_url(city_url)
+    city_lst_json = extract_json_from_mirror(city_url)
     
     # Print the response to debug
     if not city_lst_json:
@@ -174,8 +157,8 @@ def extract_single_city_weather(city_name: str) -> dict:
         print("Missing WEATHER_KEY in environment variables.")
         return None
 
-    weather_api = f"https://api.openweathermap.org/data/2.5/weather?q={city_name}&appid={api_key}&units=metric"
-    weather_json = extract_json_from_url(weather_api)
+    weather_api = f"{WEATHER_BASE_URL}/weather?q={city_name}&appid={api_key}&units=metric"
+    weather_json = weather_cache.get_or_fetch(city_key(city_name), lambda: extract_json_from_url(weather_api, weather_limiter))
 
     try:
         city_weather_dict = {
@@ -187,9 +170,9 @@ def extract_single_city_weather(city_name: str) -> dict:
         return city_weather_dict
 
     except KeyError as e:
-        print(f"Missing key {e} for city {city_name}")
+        logger.debug("Missing key %s for city %s", e, city_name)
     except Exception as e:
-        print(f"Error processing weather data for {city_name}: {e}")
+        logger.warning("Error processing weather data for %s: %s", city_name, e)
 
     return None
 
@@ -198,18 +181,21 @@ def extract_all_cities_weather(city_names: list):
     all_result_lst = []
     valid_city_names = [city for city in city_names if isinstance(city, str) and city.strip()]
 
-    for i, city_name in enumerate(valid_city_names):
-        print(f"Fetching weather for {city_name} ({i+1}/{len(valid_city_names)})")
+    progress = ProgressLogger(logger, len(valid_city_names), "Weather")
+    for city_name in valid_city_names:
         if city_dict := extract_single_city_weather(city_name):
             all_result_lst.append(city_dict)
         else:
-            print(f"Skipping {city_name} due to missing data.")
+            logger.debug("Skipping %s due to missing data.", city_name)
+        progress.update(failed=city_dict is None)
+    progress.close()
 
     if not all_result_lst:
         print("No valid weather data collected.")
         return pd.DataFrame()
 
-    all_df = pd.DataFrame(all_result_lst)
+    # Typed columns (categorical condition, float32 temperatures) keep the frame small
+    all_df = apply_schema(pd.DataFrame(all_result_lst), WEATHER_SCHEMA)
     return all_df
 
 # Transformation function to merge data
@@ -253,13 +239,17 @@ def transform():
 
     print_df(final_df)
 
-# Load data into SQLite database
+# Load data into Postgres with COPY when POSTGRES_DSN is set, otherwise into SQLite database
+# SQLite rows are upserted on (iso_country_code, city), so only changed rows are rewritten
 def load_data(df: pd.DataFrame, table_name: str):
-    engine = create_engine("sqlite:///class_demo.db")
-    df.to_sql(table_name, con=engine, index=False, if_exists="replace")
+    if os.getenv("POSTGRES_DSN"):
+        load_to_postgres(df, table_name)
+        return
+    upsert_to_sqlite(df, "class_demo.db", table_name, index_columns=("country_iso3", "country_capital"))
 
 # Execute the script
 if __name__ == "__main__":
     transform()
+    print(f"Weather cache: {weather_cache.stats()}")
 
 
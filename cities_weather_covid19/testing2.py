@@ -1,23 +1,52 @@
-import requests
 import pandas as pd
 import numpy as np
 import os
-import logging
 from sqlalchemy import create_engine
 from dotenv import load_dotenv
+
+import sys
+# Shared helpers live in project/utils
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "project"))
+from utils.rate_limiter import shared_limiter
+from utils.http_client import http_get
+from utils.dataset_mirror import shared_mirror
+from utils.covid_loader import covid_frame, COVID_COLUMNS
+from utils.schema import WEATHER_SCHEMA, apply_schema
+from utils.weather_cache import shared_cache, url_namespace, city_key
+from utils.hedging import shared_policy, hedged_call
+from utils.etl_logging import get_logger, ProgressLogger
+from utils.stage_dag import Stage, run_stages
+from concurrent.futures import ThreadPoolExecutor
+
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,  
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Point this at a local stand-in (project/utils/openweather_stub.py) to test without the real API
+WEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+
+# One limiter shared by every OpenWeather call in this run
+weather_limiter = shared_limiter("openweather")
+# Responses are reused across runs until they are older than WEATHER_CACHE_TTL; answers
+# from a stand-in are cached apart from real ones
+weather_cache = shared_cache("openweather", url_namespace(WEATHER_BASE_URL))
+# Times every weather lookup and, with WEATHER_HEDGE=1, backs up the slowest ones
+weather_hedge = shared_policy("openweather")
+
+# Configure logging: queued, to the console (LOG_LEVEL) and a rotating file (LOG_FILE)
+logger = get_logger("weather")
 
 # Function to fetch JSON from a given URL
-def extract_json_from_url(url: str):
+def extract_json_from_url(url: str, limiter=None):
     try:
         print(f"Extracting data from {url} ...")
-        return requests.get(url).json()
+        return http_get(url, limiter=limiter).json()
+    except Exception as e:
+        raise ConnectionError(f"Can't extract data: {e}")
+
+# Function to read a large dataset through the local mirror
+def extract_json_from_mirror(url: str):
+    try:
+        print(f"Reading {url} through the local mirror ...")
+        return shared_mirror().load_json(url)
     except Exception as e:
         raise ConnectionError(f"Can't extract data: {e}")
 
@@ -25,23 +54,9 @@ def extract_json_from_url(url: str):
 def get_covid_data() -> pd.DataFrame:
     covid_url = "https://raw.githubusercontent.com/owid/covid-19-data/refs/heads/master/public/data/latest/owid-covid-latest.json"
     print("Fetching COVID-19 dataset ...")
-    covid_json = extract_json_from_url(covid_url)
-    df_lst = []
-
-    for country_code in covid_json.keys():
-        single_country_df = pd.json_normalize(covid_json[country_code])
-        single_country_df['iso_country_code'] = country_code
-        df_lst.append(single_country_df)
-    
-    all_countries_df = pd.concat(df_lst, ignore_index=True)
-    all_countries_df.replace(r"^\s*$", np.nan, regex=True, inplace=True)
-    all_countries_df.dropna(how='all', axis=1, inplace=True)
-
-    selected_cols = ["iso_country_code", "continent", "location", "last_updated_date", 
-                     "total_cases", "new_cases", "total_deaths", "new_deaths", 
-                     "total_cases_per_million", "total_deaths_per_million", "hosp_patients"]
-    
-    selected_df = all_countries_df[selected_cols]
+    covid_json = extract_json_from_mirror(covid_url)
+    # One pass per selected column straight from the JSON; blanks become NaN and each column gets its declared dtype
+    selected_df = covid_frame(covid_json, COVID_COLUMNS)
     print(f"COVID-19 dataset extracted. Shape: {selected_df.shape}")
     
     return selected_df
@@ -50,7 +65,7 @@ def get_covid_data() -> pd.DataFrame:
 def get_cities_data() -> pd.DataFrame:
     cities_url = "https://raw.githubusercontent.com/dr5hn/countries-states-cities-database/refs/heads/master/json/countries%2Bcities.json"
     print("Fetching cities dataset ...")
-    cities_json = extract_json_from_url(cities_url)
+    cities_json = extract_json_from_mirror(cities_url)
 
     required_data = []
     for country in cities_json:
@@ -72,10 +87,10 @@ def get_cities_data() -> pd.DataFrame:
 # Fetch weather data for a city
 def get_city_weather(city_name: str) -> dict:
     api_key = os.getenv("WEATHER_KEY")
-    weather_api = f"https://api.openweathermap.org/data/2.5/weather?q={city_name}&appid={api_key}&units=metric"
+    weather_api = f"{WEATHER_BASE_URL}/weather?q={city_name}&appid={api_key}&units=metric"
     
     try:
-        weather_json = extract_json_from_url(weather_api)
+        weather_json = weather_cache.get_or_fetch(city_key(city_name), lambda: extract_json_from_url(weather_api, weather_limiter))
         required_dict = {
             "condition": weather_json['weather'][0].get('description', "Unknown weather"),
             "temperature_min": weather_json['main'].get('temp_min', np.nan),
@@ -84,10 +99,10 @@ def get_city_weather(city_name: str) -> dict:
         }
         return required_dict
     except ConnectionError:
-        logging.warning(f"Failed to fetch weather data for {city_name}")
+        logger.debug("Failed to fetch weather data for %s", city_name)
         return None
     except Exception as e:
-        logging.error(f"Unexpected error for {city_name}: {e}")
+        logger.error("Unexpected error for %s: %s", city_name, e)
         return None
 
 # Fetch weather data for all capital cities
@@ -95,29 +110,42 @@ def get_all_cities_weather(city_names_lst: list) -> pd.DataFrame:
     print("Fetching weather data for all capital cities ...")
     all_data = []
 
-    for idx, city_name in enumerate(city_names_lst):
-        print(f"Fetching weather for {city_name} ({idx+1}/{len(city_names_lst)}) ...")
-        city_weather = get_city_weather(city_name)
-        if city_weather:
-            all_data.append(city_weather)
+    progress = ProgressLogger(logger, len(city_names_lst), "Weather")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for city_name in city_names_lst:
+            city_weather = hedged_call(weather_hedge, executor, get_city_weather, city_name)
+            if city_weather:
+                all_data.append(city_weather)
+            progress.update(failed=not city_weather)
+    progress.close()
 
-    all_city_df = pd.DataFrame(all_data)
+    all_city_df = apply_schema(pd.DataFrame(all_data), WEATHER_SCHEMA)
     print(f"Weather dataset extracted. Shape: {all_city_df.shape}")
+    print(f"Per-city latency: {weather_hedge.stats()}")
     
     return all_city_df
 
+# Fetch weather data for every country capital
+def get_capitals_weather(city_df: pd.DataFrame) -> pd.DataFrame:
+    return get_all_cities_weather(city_df['country_capital'].to_list())
+
+# Merge cities with weather on the capital, then COVID-19 data on the ISO3 code
+def merge_data(city_df: pd.DataFrame, weather_df: pd.DataFrame, covid_df: pd.DataFrame) -> pd.DataFrame:
+    city_weather_df = city_df.merge(weather_df, how="inner", left_on='country_capital', right_on='city')
+    return covid_df.merge(city_weather_df, how="left", left_on="iso_country_code", right_on="country_iso3")
+
 # Merge datasets (Cities + Weather + COVID-19)
+# The COVID-19 download runs alongside the cities and weather fetches
 def transform_data():
     print("\nStarting data transformation ...")
     
-    city_df = get_cities_data()
-    capital_names = city_df['country_capital'].to_list()
-    
-    weather_df = get_all_cities_weather(capital_names)
-    city_weather_df = city_df.merge(weather_df, how="inner", left_on='country_capital', right_on='city')
-
-    covid_df = get_covid_data()
-    covid_city_weather_df = covid_df.merge(city_weather_df, how="left", left_on="iso_country_code", right_on="country_iso3")
+    values = run_stages([
+        Stage("cities", get_cities_data, outputs=("city_df",)),
+        Stage("weather", get_capitals_weather, ("city_df",), ("weather_df",)),
+        Stage("covid", get_covid_data, outputs=("covid_df",)),
+        Stage("merge", merge_data, ("city_df", "weather_df", "covid_df"), ("covid_city_weather_df",)),
+    ])
+    covid_city_weather_df = values["covid_city_weather_df"]
     
     print(f"Data transformation completed. Final shape: {covid_city_weather_df.shape}")
     
@@ -136,4 +164,5 @@ if __name__ == "__main__":
     df = transform_data()
     print("\nFinal DataFrame Shape:", df.shape)
     load_data(df)
+    print(f"Weather cache: {weather_cache.stats()}")
     print("=== ETL Process Completed Successfully ===")
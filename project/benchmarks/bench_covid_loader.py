@@ -0,0 +1,66 @@
+# Compares the old per-country COVID frame builders with utils.covid_loader.covid_frame
+# on the bundled covid19.json, in build time and memory per row. Run from the repo root: python project/benchmarks/bench_covid_loader.py
+import os
+import sys
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+from utils.covid_loader import covid_frame, COVID_COLUMNS
+
+COVID_JSON_PATH = os.path.join(PROJECT_DIR, "covid19.json")
+REPEATS = 5
+
+
+# What m_c_w_c.py / KP_... did: one json_normalize frame per country, concat, regex blank replace
+def json_normalize_concat(covid_json: dict):
+    country_dfs_lst = []
+    for country_code, country_data in covid_json.items():
+        if isinstance(country_data, dict):
+            single_country_df = pd.json_normalize(country_data)
+            single_country_df['iso_country_code'] = country_code
+            country_dfs_lst.append(single_country_df)
+    all_df = pd.concat(country_dfs_lst, ignore_index=True)
+    select_df = all_df[[col for col in COVID_COLUMNS if col in all_df.columns]]
+    return select_df.replace(r"^\s*$", np.nan, regex=True)
+
+
+# What project's extract_covid did: an object-dtype frame, transposed
+def dataframe_transpose(covid_json: dict):
+    covid_country_df = pd.DataFrame(covid_json).T
+    covid_country_df.reset_index(inplace=True)
+    covid_country_df.rename(columns={'index': 'iso_country_code'}, inplace=True)
+    return covid_country_df[COVID_COLUMNS]
+
+
+def best_time(func, covid_json: dict):
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        func(covid_json)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def bytes_per_row(df: pd.DataFrame):
+    return df.memory_usage(deep=True).sum() / len(df)
+
+
+def main():
+    with open(COVID_JSON_PATH, "r", encoding="utf-8") as f:
+        covid_json = json.load(f)
+
+    new_time = best_time(covid_frame, covid_json)
+    print(f"covid19.json: {len(covid_json)} entries, best of {REPEATS} runs\n")
+    print(f"{'builder':<24}{'seconds':>10}{'speedup':>10}{'bytes/row':>12}")
+    for name, func in [("json_normalize_concat", json_normalize_concat), ("dataframe_transpose", dataframe_transpose), ("covid_frame", covid_frame)]:
+        old_time = new_time if func is covid_frame else best_time(func, covid_json)
+        print(f"{name:<24}{old_time:>10.4f}{old_time / new_time:>9.1f}x{bytes_per_row(func(covid_json)):>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# Per-city p50/p99 of the weather fetch engine with hedging off and on, against a local
+# stand-in (utils/openweather_stub.py) that answers most requests quickly and a few very slowly.
+# Requests take the pipeline's own path: etl_utils.get_weather_json through the shared
+# HTTP client, the adaptive rate limiter and the weather cache (a fresh one per run).
+# Run from the repo root: python project/benchmarks/bench_hedging.py
+import os
+import sys
+import time
+import tempfile
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+from utils.openweather_stub import OpenWeatherStub, LatencyModel
+
+CITIES = 400
+CONCURRENCY = 10
+FAST_SECONDS = 0.02
+SLOW_SECONDS = 1.0
+SLOW_SHARE = 0.03
+# A paid-tier quota, so the limiter paces the run without being the whole story
+MAX_RATE = 200
+
+
+def run(stub: OpenWeatherStub, cities: list, enabled: bool, cache_path: str):
+    from utils import etl_utils
+    from utils.weather_fetch import fetch_weather_results
+    from utils.weather_cache import WeatherCache, url_namespace
+    from utils.rate_limiter import AdaptiveRateLimiter
+    from utils.hedging import HedgePolicy
+
+    etl_utils.weather_limiter = AdaptiveRateLimiter.from_env()
+    etl_utils.weather_cache = WeatherCache(cache_path, namespace=url_namespace(stub.base_url))
+    hedge = HedgePolicy(enabled=enabled)
+
+    started = time.perf_counter()
+    fetch_weather_results(cities, etl_utils.extract_weather_by_city, etl_utils.extract_weather_by_coord, CONCURRENCY, hedge=hedge)
+    return time.perf_counter() - started, stub.stats()['requests'], hedge.stats(), etl_utils.weather_limiter.stats()
+
+
+def main():
+    cities = [{'city': f"city{i}", 'latitude': i % 90, 'longitude': i % 180} for i in range(CITIES)]
+    latency = LatencyModel(f"fixed:{FAST_SECONDS}", SLOW_SHARE, SLOW_SECONDS)
+
+    with OpenWeatherStub.from_file(latency=latency) as stub, tempfile.TemporaryDirectory() as workdir:
+        # etl_utils reads these when it is first imported
+        os.environ["OPENWEATHER_BASE_URL"] = stub.base_url
+        os.environ.setdefault("WEATHER_KEY", "bench")
+        os.environ.setdefault("LOG_FILE", "")
+        os.environ.setdefault("OPENWEATHER_MAX_RATE", str(MAX_RATE))
+        os.environ.setdefault("WEATHER_CONCURRENCY", str(CONCURRENCY))
+
+        print(f"{CITIES} cities, {CONCURRENCY} in flight, {SLOW_SHARE:.0%} of requests take {SLOW_SECONDS}s, "
+              f"rate limit {os.environ['OPENWEATHER_MAX_RATE']}/s\n")
+        print(f"{'hedging':<10}{'p50 ms':>10}{'p99 ms':>10}{'total s':>10}{'requests':>10}{'hedges':>8}{'wins':>6}{'throttled':>11}")
+        for enabled in (False, True):
+            stub.reset(seed=7)
+            total, served, stats, limiter = run(stub, cities, enabled, os.path.join(workdir, f"cache_{enabled}.db"))
+            print(f"{stats['hedging']:<10}{stats['p50_ms']:>10}{stats['p99_ms']:>10}{total:>10.2f}{served:>10}"
+                  f"{stats['hedges']:>8}{stats['hedge_wins']:>6}{limiter['throttled']:>11}")
+
+
+if __name__ == '__main__':
+    main()
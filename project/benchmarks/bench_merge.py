@@ -0,0 +1,76 @@
+# Merge time of the COVID frame against weather frames of growing size, joining on
+# free-text country names, on aligned name categoricals and on the ISO3 key
+# (as a categorical, as its integer codes and with the weather frame on the left).
+# Run from the repo root: python project/benchmarks/bench_merge.py
+import os
+import sys
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+from utils.covid_loader import covid_frame, COVID_COLUMNS
+from utils.schema import align_categories
+
+COVID_JSON_PATH = os.path.join(PROJECT_DIR, "covid19.json")
+WEATHER_ROWS = [10000, 100000, 1000000, 3000000]
+REPEATS = 3
+
+
+def weather_frame(covid_df: pd.DataFrame, rows: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    picked = rng.integers(0, len(covid_df), rows)
+    return pd.DataFrame({
+        'Country': covid_df['location'].astype(object).to_numpy()[picked],
+        'ISO3': covid_df['iso_country_code'].astype(object).to_numpy()[picked],
+        'City': [f"city{i}" for i in range(rows)],
+        'Min_Temperature': rng.normal(20, 5, rows).astype('float32'),
+    })
+
+
+# Each join gets frames already carrying its key, as the pipeline builds them at ingest;
+# only the merge itself is timed.
+def keyed_frames(covid_df: pd.DataFrame, weather_df: pd.DataFrame, key: str):
+    if key == "names":
+        return covid_df, weather_df, 'location', 'Country'
+    if key == "name categories":
+        left, right = align_categories(covid_df['location'].astype('category'), weather_df['Country'].astype('category'))
+        return covid_df.assign(location=left), weather_df.assign(Country=right), 'location', 'Country'
+    left, right = align_categories(covid_df['iso_country_code'].astype('category'), weather_df['ISO3'].astype('category'))
+    if key == "ISO3 category":
+        return covid_df.assign(ISO3=left), weather_df.assign(ISO3=right), 'ISO3', 'ISO3'
+    if key == "ISO3 weather-left":
+        # What transform_final_df does: the big frame drives the join and keeps its row order
+        return weather_df.assign(ISO3=right), covid_df.assign(ISO3=left), 'ISO3', 'ISO3'
+    # The category codes themselves as a small integer column
+    return covid_df.assign(ISO3=left.cat.codes), weather_df.assign(ISO3=right.cat.codes), 'ISO3', 'ISO3'
+
+
+def best_time(covid_df: pd.DataFrame, weather_df: pd.DataFrame, key: str):
+    left_df, right_df, left_on, right_on = keyed_frames(covid_df, weather_df, key)
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        left_df.merge(right_df, how='inner', left_on=left_on, right_on=right_on)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    with open(COVID_JSON_PATH, "r", encoding="utf-8") as f:
+        covid_df = covid_frame(json.load(f), COVID_COLUMNS)
+    covid_df['location'] = covid_df['location'].astype(object)
+
+    keys = ["names", "name categories", "ISO3 category", "ISO3 int codes", "ISO3 weather-left"]
+    print(f"COVID frame: {len(covid_df)} rows, merge seconds, best of {REPEATS} runs\n")
+    print(f"{'weather rows':>12}" + "".join(f"{key:>19}" for key in keys))
+    for rows in WEATHER_ROWS:
+        weather_df = weather_frame(covid_df, rows)
+        print(f"{rows:>12}" + "".join(f"{best_time(covid_df, weather_df, key):>19.3f}" for key in keys))
+
+
+if __name__ == '__main__':
+    main()
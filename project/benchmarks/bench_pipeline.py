@@ -0,0 +1,312 @@
+# Offline benchmark suite for the extract / transform / load stages, built from the bundled
+# fixtures (project/covid19.json, cities_weather_covid19/countries_cities.json and
+# weather_data.json) at several scale factors. No request leaves the machine: the cities
+# file is served from a local HTTP server and the country code lookup is built from the
+# fixtures. Results are written as JSON so runs can be compared with --compare.
+# Run from the repo root: python project/benchmarks/bench_pipeline.py [--scales 0.1 1 10] [--compare OLD.json]
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+import statistics
+import contextlib
+import subprocess
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(PROJECT_DIR)
+SCRIPTS_DIR = os.path.join(REPO_DIR, "cities_weather_covid19")
+sys.path.append(PROJECT_DIR)
+sys.path.append(SCRIPTS_DIR)
+
+COVID_JSON_PATH = os.path.join(PROJECT_DIR, "covid19.json")
+COUNTRIES_CITIES_PATH = os.path.join(SCRIPTS_DIR, "countries_cities.json")
+WEATHER_JSON_PATH = os.path.join(SCRIPTS_DIR, "weather_data.json")
+RESULTS_DIR = os.path.join(PROJECT_DIR, "benchmarks", "results")
+
+SCALES = [0.1, 1, 10]
+REPEATS = 3
+# Weather rows at scale 1: a mid-sized harvest; every fixture response is reused for many cities
+WEATHER_BASE_ROWS = 10000
+# Countries whose cities extract_cities keeps (it still has to read the whole array)
+TARGET_COUNTRIES = 10
+
+
+# Fixture data
+
+def load_fixtures():
+    with open(COVID_JSON_PATH, "r", encoding="utf-8") as f:
+        covid_json = json.load(f)
+    with open(COUNTRIES_CITIES_PATH, "r", encoding="utf-8") as f:
+        countries_cities = json.load(f)
+    with open(WEATHER_JSON_PATH, "r", encoding="utf-8") as f:
+        weather_responses = json.load(f)
+    # Countries present in both fixtures, keyed by name -> ISO3 code
+    covid_codes = {entry["location"]: code for code, entry in covid_json.items()
+                   if isinstance(entry, dict) and entry.get("continent")}
+    name_to_iso3 = {country["name"]: covid_codes[country["name"]] for country in countries_cities if country["name"] in covid_codes}
+    return covid_json, countries_cities, weather_responses, name_to_iso3
+
+
+# The country lookup normally comes from the dr5hn countries list online. Offline it is
+# built from the fixtures, with the ISO3 code standing in for ISO2 in the city records.
+def install_country_keys(name_to_iso3: dict):
+    from utils import country_keys
+    country_keys._shared_keys = country_keys.CountryKeys.from_json(
+        [{"iso2": iso3, "iso3": iso3} for iso3 in sorted(set(name_to_iso3.values()))]
+    )
+
+
+def scaled_items(items: list, scale: float):
+    if scale <= 1:
+        return items[:max(1, int(len(items) * scale))]
+    return [item for _ in range(int(scale)) for item in items]
+
+
+# COVID JSON with scale x as many entries; copies get suffixed codes
+def scaled_covid_json(covid_json: dict, scale: float):
+    entries = list(covid_json.items())
+    if scale <= 1:
+        return dict(entries[:max(1, int(len(entries) * scale))])
+    return {code if copy == 0 else f"{code}_{copy}": entry for copy in range(int(scale)) for code, entry in entries}
+
+
+# City records shaped like the dr5hn cities.json array that extract_cities streams
+def city_records(countries_cities: list, name_to_iso3: dict):
+    records = []
+    for country in countries_cities:
+        for position, city in enumerate(country.get("cities", [])):
+            records.append({
+                "name": city,
+                "state_name": None,
+                "country_code": name_to_iso3.get(country["name"]),
+                "country_name": country["name"],
+                "latitude": str(round(position * 0.01 % 90, 4)),
+                "longitude": str(round(position * 0.02 % 180, 4)),
+            })
+    return records
+
+
+# A weather frame of `rows` cities as extract_weather_data builds it, cycling through the
+# fixture responses; city names stay unique so the SQLite keys do not collide.
+def weather_frame(city_rows: list, weather_responses: list, rows: int):
+    from utils.etl_utils import build_weather_record
+    from utils.schema import WEATHER_SCHEMA, apply_schema
+    from utils.country_keys import shared_country_keys
+
+    records = []
+    for position in range(rows):
+        city = dict(city_rows[position % len(city_rows)])
+        if position >= len(city_rows):
+            city["city"] = f"{city['city']} #{position // len(city_rows)}"
+        records.append(build_weather_record(city, weather_responses[position % len(weather_responses)]))
+    weather_df = apply_schema(pd.DataFrame(records), WEATHER_SCHEMA)
+    weather_df["ISO3"] = weather_df["ISO3"].astype(object).astype(shared_country_keys().dtype)
+    return weather_df
+
+
+# Serves one JSON file to extract_cities from 127.0.0.1
+class FixtureServer:
+    def __init__(self):
+        self.body = b"[]"
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(fixture.body)))
+                self.end_headers()
+                self.wfile.write(fixture.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/cities.json"
+
+    def close(self):
+        self.server.shutdown()
+
+
+# Timing
+
+def timed_runs(func, repeats: int, setup=None):
+    timings = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def result(stage: str, scale: float, rows: int, timings: list):
+    best = min(timings)
+    return {
+        'stage': stage,
+        'scale': scale,
+        'rows': rows,
+        'repeats': len(timings),
+        'best_seconds': round(best, 6),
+        'median_seconds': round(statistics.median(timings), 6),
+        'rows_per_second': round(rows / best, 1) if best > 0 else None,
+    }
+
+
+def remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def run_suite(scales: list, repeats: int, workdir: str):
+    from utils.etl_utils import extract_covid, extract_cities, transform_final_df, load_to_csv, load_to_excel
+    import m_c_w_c
+    import KP_merging_covid19_with_cityWeather as kp
+
+    covid_json, countries_cities, weather_responses, name_to_iso3 = load_fixtures()
+    install_country_keys(name_to_iso3)
+    all_city_records = city_records(countries_cities, name_to_iso3)
+    # The weather frame is built from cities whose country has COVID data, as in a real run
+    known_city_rows = [
+        {'city': record['name'], 'country_name': record['country_name'], 'state': record['state_name'],
+         'latitude': record['latitude'], 'longitude': record['longitude'], 'ISO3': record['country_code']}
+        for record in all_city_records if record['country_code']
+    ]
+    targets = [country["name"] for country in countries_cities if country["name"] in name_to_iso3][:TARGET_COUNTRIES]
+    server = FixtureServer()
+
+    results = []
+    try:
+        for scale in scales:
+            print(f"\n scale {scale}")
+
+            scaled_json = scaled_covid_json(covid_json, scale)
+            covid_path = os.path.join(workdir, "covid19.json")
+            with open(covid_path, "w", encoding="utf-8") as f:
+                json.dump(scaled_json, f)
+            results.append(result("extract_covid", scale, len(scaled_json), timed_runs(lambda: extract_covid(covid_path), repeats)))
+            # The scripts' builders, with the mirror download swapped for the fixture
+            m_c_w_c.extract_json_from_mirror = lambda url: scaled_json
+            kp.extract_json_from_mirror = lambda url: scaled_json
+            results.append(result("m_c_w_c.extract_covid_data", scale, len(scaled_json), timed_runs(m_c_w_c.extract_covid_data, repeats)))
+            results.append(result("KP.get_covid_data", scale, len(scaled_json), timed_runs(kp.get_covid_data, repeats)))
+
+            cities = scaled_items(all_city_records, scale)
+            server.body = json.dumps(cities).encode("utf-8")
+            results.append(result("extract_cities", scale, len(cities),
+                                  timed_runs(lambda: extract_cities(server.url, targets, per_country=None), repeats)))
+
+            covid_df = extract_covid(COVID_JSON_PATH)
+            weather_df = weather_frame(known_city_rows, weather_responses, int(WEATHER_BASE_ROWS * scale))
+            results.append(result("transform_final_df", scale, len(weather_df), timed_runs(lambda: transform_final_df(covid_df, weather_df), repeats)))
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                final_df = transform_final_df(covid_df, weather_df)
+            table = os.path.join(workdir, "City_Weather_Covid_Data")
+            results.append(result("load_to_csv", scale, len(final_df), timed_runs(lambda: load_to_csv(final_df, table), repeats)))
+            results.append(result("load_to_excel", scale, len(final_df), timed_runs(lambda: load_to_excel(final_df, table), repeats)))
+
+            # The scripts' SQLite load_data writes class_demo.db in the working directory;
+            # each run starts from an empty database
+            iso3 = final_df['Country'].astype(object).map(name_to_iso3)
+            script_df = final_df.rename(columns={'City': 'city'}).assign(iso_country_code=iso3, country_iso3=iso3, country_capital=final_df['City'])
+            results.append(result("m_c_w_c.load_data (sqlite)", scale, len(script_df),
+                                  timed_runs(lambda: m_c_w_c.load_data(script_df, "covid_city_demo"), repeats,
+                                             setup=lambda: [remove(f"class_demo.db{suffix}") for suffix in ("", "-wal", "-shm")])))
+
+            for entry in results[-8:]:
+                print(f"   {entry['stage']:<30}{entry['rows']:>10} rows{entry['best_seconds']:>10.3f}s best{entry['median_seconds']:>10.3f}s median")
+    finally:
+        server.close()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': git_commit(),
+    }
+
+
+# Prints new/old best time per stage and scale for the entries both runs have
+def compare(new: dict, old_path: str):
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    old_results = {(entry['stage'], entry['scale']): entry for entry in old['results']}
+    print(f"\n Compared with {old_path} ({old['environment'].get('git_commit')}), best seconds:")
+    print(f"   {'stage':<30}{'scale':>7}{'old':>10}{'new':>10}{'new/old':>10}")
+    for entry in new['results']:
+        before = old_results.get((entry['stage'], entry['scale']))
+        if before is None:
+            continue
+        ratio = entry['best_seconds'] / before['best_seconds'] if before['best_seconds'] else float("nan")
+        print(f"   {entry['stage']:<30}{entry['scale']:>7}{before['best_seconds']:>10.3f}{entry['best_seconds']:>10.3f}{ratio:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the ETL stages")
+    parser.add_argument("--scales", type=float, nargs="+", default=SCALES, help="fixture scale factors (default: 0.1 1 10)")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--output", help="results file (default: project/benchmarks/results/pipeline_<UTC time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    args = parser.parse_args()
+
+    started_at = datetime.now(timezone.utc)
+    output = os.path.abspath(args.output or os.path.join(RESULTS_DIR, f"pipeline_{started_at:%Y%m%d-%H%M%S}.json"))
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    # Caches, indexes, logs and output files of the run stay in a scratch directory
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.pop("POSTGRES_DSN", None)
+        os.environ.setdefault("LOG_FILE", "")
+        os.chdir(workdir)
+        try:
+            results = run_suite(args.scales, args.repeats, workdir)
+        finally:
+            os.chdir(original_dir)
+
+    report = {
+        'started_at': started_at.isoformat(),
+        'environment': environment(),
+        'scales': args.scales,
+        'repeats': args.repeats,
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n Results written to {output}")
+    if compare_path:
+        compare(report, compare_path)
+
+
+if __name__ == '__main__':
+    main()
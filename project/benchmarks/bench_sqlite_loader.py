@@ -0,0 +1,69 @@
+# Load times of the old to_sql(if_exists="replace") and utils.sqlite_loader.upsert_to_sqlite
+# for 10k and 1M rows shaped like the merged COVID / city weather table: a first load,
+# a rerun with nothing changed and a rerun with 1% of the rows changed.
+# Run from the repo root: python project/benchmarks/bench_sqlite_loader.py
+import io
+import os
+import sys
+import time
+import tempfile
+import contextlib
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+from utils.sqlite_loader import upsert_to_sqlite
+
+ROW_COUNTS = [10000, 1000000]
+CHANGED_SHARE = 0.01
+
+
+def merged_frame(rows: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    countries = np.array([f"C{i:02d}" for i in range(rows // 1000 + 1)])
+    return pd.DataFrame({
+        'iso_country_code': countries[np.arange(rows) // 1000],
+        'city': [f"city{i}" for i in range(rows)],
+        'country_iso3': countries[np.arange(rows) // 1000],
+        'country_capital': [f"capital{i // 1000}" for i in range(rows)],
+        'weather_condition': rng.choice(['clear sky', 'light rain', 'overcast clouds'], rows),
+        'temperature_min': rng.normal(20, 5, rows).round(2),
+        'temperature_max': rng.normal(25, 5, rows).round(2),
+        'total_cases': rng.integers(0, 10_000_000, rows),
+        'total_deaths': rng.integers(0, 100_000, rows),
+    })
+
+
+def timed(func):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+    return time.perf_counter() - started
+
+
+def main():
+    print(f"{'rows':>9}  {'loader':<28}{'first load s':>14}{'unchanged s':>13}{'1% changed s':>14}")
+    for rows in ROW_COUNTS:
+        df = merged_frame(rows)
+        changed = df.copy()
+        picked = changed.sample(frac=CHANGED_SHARE, random_state=1).index
+        changed.loc[picked, 'temperature_max'] += 1
+
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'to_sql.db')}")
+            to_sql = lambda frame: frame.to_sql('covid_city_demo', engine, index=False, if_exists='replace')
+            times = [timed(lambda: to_sql(df)), timed(lambda: to_sql(df)), timed(lambda: to_sql(changed))]
+            engine.dispose()
+            print(f"{rows:>9}  {'to_sql replace':<28}{times[0]:>14.2f}{times[1]:>13.2f}{times[2]:>14.2f}")
+
+            db_path = os.path.join(directory, 'upsert.db')
+            upsert = lambda frame: upsert_to_sqlite(frame, db_path, 'covid_city_demo', index_columns=('country_iso3',))
+            times = [timed(lambda: upsert(df)), timed(lambda: upsert(df)), timed(lambda: upsert(changed))]
+            print(f"{rows:>9}  {'upsert_to_sqlite':<28}{times[0]:>14.2f}{times[1]:>13.2f}{times[2]:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
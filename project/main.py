@@ -1,53 +1,135 @@
 import os
-import json
+import time
 import pandas as pd
-from utils.etl_utils import extract_covid, extract_cities, extract_weather_data, transform_final_df, load_to_files
+from utils.etl_utils import extract_covid, extract_cities, extract_weather_data, transform_final_df, load_to_files, weather_cache, WEATHER_BASE_URL
+from utils.covid_loader import CovidSnapshot
+from utils.pg_loader import load_to_postgres
+from utils.telemetry import shared_telemetry
+from utils.country_keys import shared_country_keys, COUNTRIES_URL
+from utils.stage_dag import Stage, run_stages
+from utils.stage_cache import shared_stage_cache, file_digest
 
 # Paths to local JSON files
 covid_json_path = "./project/covid19.json"
 cities_url = "https://raw.githubusercontent.com/dr5hn/countries-states-cities-database/refs/heads/master/json/cities.json"
 
-def get_top_3_death_countries_from_local(file_path: str):
-    with open(file_path, "r") as f:
-        data = json.load(f)
-    
-    countries = [
-        {"country_code": code, "country_name": value["location"], "total_deaths": value.get("total_deaths") or 0}
-        for code, value in data.items()
-        if value.get("continent")  # Filter out continents like "OWID_AFR"
-    ]
-    
-    sorted_countries = sorted(countries, key=lambda x: x["total_deaths"], reverse=True)
-    top_3 = sorted_countries[:3]
-    return [country["country_name"] for country in top_3]
+# Maximum number of weather requests in flight at once
+weather_concurrency = int(os.getenv("WEATHER_CONCURRENCY", "10"))
+# Use OpenWeather's multi-city endpoints before falling back to one request per city
+weather_batch = os.getenv("WEATHER_BATCH", "0") == "1"
+# Cities closer than this many km share one weather lookup (0 turns it off)
+weather_dedupe_km = float(os.getenv("WEATHER_DEDUPE_KM", "0"))
+# Progress journal that lets an interrupted weather harvest pick up where it stopped
+weather_journal_path = os.getenv("WEATHER_JOURNAL", "weather_harvest.jsonl")
 
-# Extracting data
-def main():
-    print(" Starting ETL pipeline...")
+# How many countries to take and which COVID column to rank them by
+top_n_countries = int(os.getenv("TOP_N_COUNTRIES", "3"))
+top_metric = os.getenv("TOP_METRIC", "total_deaths")
+
+# Output formats written side by side: csv, xlsx, parquet, feather
+output_formats = [name.strip() for name in os.getenv("OUTPUT_FORMATS", "csv,xlsx").split(",") if name.strip()]
+
+# When set, the final table is also bulk loaded into this Postgres database
+postgres_dsn = os.getenv("POSTGRES_DSN")
 
-    print("\n Step 1: Extracting COVID data from local JSON...")
-    covid_df = extract_covid(covid_json_path)
+# Cached weather frames are reused for as long as the weather cache keeps responses (0: never)
+weather_ttl = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+# The cities dataset changes rarely; its cached extract is keyed by the day
+cities_ttl = 86400
+
+# Per-stage and per-request numbers of each run, as JSON and as a Prometheus textfile
+telemetry_json_path = os.getenv("TELEMETRY_JSON", "etl_telemetry.json")
+telemetry_prom_path = os.getenv("TELEMETRY_PROM", "etl_telemetry.prom")
+
+## Pipeline stages; each prints its own result since independent stages run side by side
+def load_covid_snapshot():
+    covid_snapshot = CovidSnapshot.from_file(covid_json_path)
+    print(f" COVID file read: {len(covid_snapshot.frame)} rows")
+    return covid_snapshot
+
+# The country code lookup is downloaded while the COVID file is parsed; both extract steps wait for it
+def load_country_keys():
+    return shared_country_keys()
+
+def extract_covid_stage(covid_snapshot: CovidSnapshot, country_keys):
+    covid_df = extract_covid(covid_snapshot, country_keys)
     print(f" COVID data extracted: {covid_df.shape[0]} rows")
+    return covid_df
 
-    top_3_country_names = get_top_3_death_countries_from_local(covid_json_path)
-    print(f"\n Top 3 countries with highest COVID deaths: {top_3_country_names}")
+def top_countries_stage(covid_snapshot: CovidSnapshot):
+    top_country_names = covid_snapshot.top_locations(top_n_countries, top_metric)
+    print(f" Top {top_n_countries} countries by {top_metric}: {top_country_names}")
+    return top_country_names
 
-    print("\n Step 2: Extracting cities data...")
-    cities_df = extract_cities(cities_url, top_3_country_names)
+def extract_cities_stage(top_country_names: list, country_keys):
+    cities_df = extract_cities(cities_url, top_country_names, country_keys=country_keys)
     print(f" Cities data extracted: {cities_df.shape[0]} rows")
+    return cities_df
 
-    print("\n Step 3: Extracting weather data for each city (this may take some time)...")
-    weather_df = extract_weather_data(cities_df)
+def extract_weather_stage(cities_df: pd.DataFrame):
+    weather_df = extract_weather_data(cities_df, weather_concurrency, weather_batch, weather_dedupe_km, weather_journal_path)
     print(f" Weather data extracted: {weather_df.shape[0]} rows")
+    return weather_df
 
-    print("\n Step 4: Transforming and merging final dataset...")
+def transform_stage(covid_df: pd.DataFrame, weather_df: pd.DataFrame):
     final_df = transform_final_df(covid_df, weather_df)
     print(f" Final data prepared: {final_df.shape[0]} rows, {final_df.shape[1]} columns")
+    return final_df
+
+def load_files_stage(final_df: pd.DataFrame):
+    load_to_files(final_df, 'City_Weather_Covid_Data', output_formats)
 
-    print("\n Step 5: Saving data to CSV and Excel files...")
-    load_to_files(final_df, 'City_Weather_Covid_Data')
+def load_postgres_stage(final_df: pd.DataFrame):
+    load_to_postgres(final_df, 'city_weather_covid', postgres_dsn)
 
+
+# COVID -> top countries -> cities -> weather is the critical path; building the COVID
+# frame runs alongside the cities and weather extraction, and the loads run side by side.
+# covid_df, cities_df, weather_df and final_df are kept in the stage cache, keyed by the
+# COVID file's digest, the settings below, the weather server, the TTL buckets and the code;
+# on a rerun with the same key a stage loads its output instead of running, and the stages
+# feeding it are skipped.
+def pipeline_stages():
+    now = time.time()
+    stages = [
+        Stage("load_covid", load_covid_snapshot, outputs=("covid_snapshot",), params={'file': file_digest(covid_json_path)}),
+        Stage("country_keys", load_country_keys, outputs=("country_keys",), params={'url': COUNTRIES_URL}),
+        Stage("extract_covid", extract_covid_stage, ("covid_snapshot", "country_keys"), ("covid_df",), cache=True),
+        Stage("top_countries", top_countries_stage, ("covid_snapshot",), ("top_country_names",),
+              params={'n': top_n_countries, 'metric': top_metric}),
+        Stage("extract_cities", extract_cities_stage, ("top_country_names", "country_keys"), ("cities_df",),
+              params={'url': cities_url, 'ttl_bucket': int(now // cities_ttl)}, cache=True),
+        Stage("extract_weather", extract_weather_stage, ("cities_df",), ("weather_df",),
+              params={'source': WEATHER_BASE_URL, 'batch': weather_batch, 'dedupe_km': weather_dedupe_km, 'ttl_bucket': int(now // weather_ttl) if weather_ttl > 0 else now}, cache=True),
+        Stage("transform", transform_stage, ("covid_df", "weather_df"), ("final_df",), cache=True),
+        Stage("load_files", load_files_stage, ("final_df",)),
+    ]
+    if postgres_dsn:
+        stages.append(Stage("load_postgres", load_postgres_stage, ("final_df",)))
+    return stages
+
+
+def run_pipeline(telemetry):
+    print(" Starting ETL pipeline...")
+    print(f" Saving to {', '.join(output_formats)} files{' and Postgres' if postgres_dsn else ''} once the data is merged.\n")
+
+    stage_cache = shared_stage_cache()
+    run_stages(pipeline_stages(), telemetry=telemetry, cache=stage_cache)
+
+    print(f"\n Weather cache: {weather_cache.stats()}")
+    print(f" Stage cache: {stage_cache.stats()}")
     print("\n ETL process completed successfully!")
 
+
+# The telemetry files are written even when a stage fails, so slow or broken runs can be diagnosed
+def main():
+    telemetry = shared_telemetry()
+    try:
+        run_pipeline(telemetry)
+    finally:
+        telemetry.write_json(telemetry_json_path)
+        telemetry.write_prometheus(telemetry_prom_path)
+        print(f" Telemetry written to {telemetry_json_path} and {telemetry_prom_path}")
+
 if __name__ == '__main__':
     main()
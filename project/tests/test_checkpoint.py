@@ -0,0 +1,34 @@
+# Run from the repo root: python -m pytest project/tests
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.checkpoint import HarvestJournal
+
+
+def crash(path: str, torn: str):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(torn)
+
+
+# crash -> resume -> crash -> resume keeps every record written in between
+def test_torn_line_does_not_swallow_later_records(tmp_path):
+    path = str(tmp_path / "harvest.jsonl")
+
+    journal = HarvestJournal(path)
+    journal.record("a", "city", {"id": 1})
+    journal.close()
+    crash(path, '{"key": "b", "sou')
+
+    journal = HarvestJournal(path)
+    assert journal.resumed == 1
+    journal.record("c", "city", {"id": 3})
+    journal.record("d", "coord", {"id": 4})
+    journal.close()
+    crash(path, '{"key": "e", "source": "ci')
+
+    journal = HarvestJournal(path)
+    journal.close()
+    assert sorted(journal.entries) == ["a", "c", "d"]
+    assert journal.get("d") == ("coord", {"id": 4})
@@ -0,0 +1,71 @@
+import os
+import json
+import threading
+
+
+# Append-only JSON Lines journal of finished lookups, one line per city:
+#   {"key": ..., "source": "city" | "coord" | null, "response": {...}}
+# A restarted harvest loads the journal, skips every key already in it and reuses the
+# stored responses. Lines are flushed as they are written and fsynced every fsync_every
+# lines, so a crash loses at most that many cities. complete() removes the journal once
+# the harvest has finished, so the next run starts fresh.
+class HarvestJournal:
+    def __init__(self, path: str, fsync_every: int = 20):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.entries = {}
+        self._pending_sync = 0
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            intact = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self.entries[entry["key"]] = (entry.get("source"), entry.get("response"))
+                    intact += len(line)
+            # A line cut short by the crash: drop it and whatever follows, so the next
+            # record starts on a fresh line instead of being glued onto the torn one
+            if intact < os.path.getsize(path):
+                with open(path, "r+b") as f:
+                    f.truncate(intact)
+        self.resumed = len(self.entries)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __contains__(self, key: str):
+        return key in self.entries
+
+    def get(self, key: str):
+        return self.entries.get(key)
+
+    def record(self, key: str, source, response: dict):
+        line = json.dumps({"key": key, "source": source, "response": response}, ensure_ascii=False)
+        with self._lock:
+            self.entries[key] = (source, response)
+            self._file.write(line + "\n")
+            self._file.flush()
+            self._pending_sync += 1
+            if self._pending_sync >= self.fsync_every:
+                os.fsync(self._file.fileno())
+                self._pending_sync = 0
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+    def complete(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
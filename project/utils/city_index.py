@@ -0,0 +1,120 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import namedtuple
+
+from .weather_cache import COORD_PRECISION
+
+
+# How a city was resolved last time: source is 'city' (by name), 'coord' (by coordinates)
+# or 'failed' (neither found it); owm_id is the OpenWeather location ID to ask for directly.
+CityEntry = namedtuple('CityEntry', ['source', 'owm_id', 'lat', 'lon'])
+
+_shared_indexes = {}
+_shared_lock = threading.Lock()
+
+
+def _round(value):
+    try:
+        return round(float(value), COORD_PRECISION)
+    except (TypeError, ValueError):
+        return None
+
+
+def index_key(city: dict):
+    name = str(city.get('city') or '').strip().lower()
+    country = str(city.get('country_name') or '').strip().lower()
+    return f"{name}|{country}|{_round(city.get('latitude'))}|{_round(city.get('longitude'))}"
+
+
+# Persistent map from (city, country, lat, lon) to the lookup that worked for it, in SQLite.
+# Cities that both lookups reported as not found are kept as a negative cache for failure_ttl seconds
+# so they are not asked for again on every run. Keys are stored under namespace, like
+# the weather cache's, so IDs issued by another server are never asked of the real API.
+class CityIndex:
+    def __init__(self, path: str, failure_ttl: float = 86400, namespace: str = ""):
+        self.path = path
+        self.failure_ttl = failure_ttl
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS city_index (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                owm_id INTEGER,
+                lat REAL,
+                lon REAL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+    @classmethod
+    def from_env(cls, namespace: str = ""):
+        return cls(
+            path=os.getenv("CITY_INDEX_PATH", "city_index.db"),
+            failure_ttl=float(os.getenv("CITY_INDEX_FAILURE_TTL", "86400")),
+            namespace=namespace,
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def key(self, city: dict):
+        return self.namespace + index_key(city)
+
+    def lookup(self, city: dict):
+        row = self._connect().execute(
+            "SELECT source, owm_id, lat, lon, updated_at FROM city_index WHERE key = ?", (self.key(city),)
+        ).fetchone()
+        if row is not None and row[0] == 'failed' and row[4] < time.time() - self.failure_ttl:
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return CityEntry(*row[:4])
+
+    def _write(self, city: dict, source: str, owm_id=None, lat=None, lon=None):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO city_index (key, source, owm_id, lat, lon, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (self.key(city), source, owm_id, lat, lon, time.time()),
+        )
+        conn.commit()
+
+    # Remembers which lookup answered for this city and the location ID it returned.
+    def record(self, city: dict, source: str, response: dict):
+        coord = response.get('coord', {})
+        self._write(city, source, response.get('id'), coord.get('lat'), coord.get('lon'))
+
+    def record_failure(self, city: dict):
+        self._write(city, 'failed')
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+# Returns the process-wide city index for a namespace, configured from env settings on first use.
+def shared_index(name: str = "openweather", namespace: str = "") -> CityIndex:
+    with _shared_lock:
+        if (name, namespace) not in _shared_indexes:
+            _shared_indexes[(name, namespace)] = CityIndex.from_env(namespace)
+        return _shared_indexes[(name, namespace)]
@@ -0,0 +1,56 @@
+import threading
+
+import pandas as pd
+
+from .dataset_mirror import shared_mirror
+
+
+# ISO2 / ISO3 / name for every country, from the same project as the cities dataset
+COUNTRIES_URL = "https://raw.githubusercontent.com/dr5hn/countries-states-cities-database/master/json/countries.json"
+
+# OWID publishes a few countries under its own codes instead of ISO3
+OWID_ISO3_ALIASES = {"OWID_KOS": "XKX"}
+
+_shared_keys = None
+_shared_lock = threading.Lock()
+# Stands in for _shared_keys once the lookup has failed, so it is tried once per process
+_UNAVAILABLE = object()
+
+
+# Lookup from country codes to a canonical ISO3 key.
+# Keys come out as categoricals over one fixed, sorted list of ISO3 codes, so every
+# frame keyed this way shares the same categories and a merge joins on the codes.
+class CountryKeys:
+    def __init__(self, countries: pd.DataFrame):
+        countries = countries.dropna(subset=["iso3"]).drop_duplicates("iso3")
+        self.dtype = pd.CategoricalDtype(sorted(countries["iso3"]))
+        self.iso2_to_iso3 = dict(zip(countries["iso2"], countries["iso3"]))
+
+    @classmethod
+    def from_json(cls, countries_json: list):
+        return cls(pd.DataFrame(
+            [{"iso2": country.get("iso2"), "iso3": country.get("iso3")} for country in countries_json],
+            columns=["iso2", "iso3"],
+        ))
+
+    def from_iso2(self, iso2: pd.Series) -> pd.Series:
+        return iso2.map(self.iso2_to_iso3).astype(self.dtype)
+
+    # OWID aggregates (OWID_WRL, OWID_EUR, ...) have no ISO3 and come out missing.
+    def from_iso3(self, iso3: pd.Series) -> pd.Series:
+        return iso3.astype(object).replace(OWID_ISO3_ALIASES).astype(self.dtype)
+
+
+# Returns the process-wide lookup, read once through the dataset mirror.
+# None when the countries list cannot be fetched and no local copy exists; a failed
+# fetch is not retried for the rest of the process.
+def shared_country_keys():
+    global _shared_keys
+    with _shared_lock:
+        if _shared_keys is None:
+            try:
+                _shared_keys = CountryKeys.from_json(shared_mirror().load_json(COUNTRIES_URL))
+            except Exception as e:
+                print(f" Country code lookup unavailable ({e}); joining on country names.")
+                _shared_keys = _UNAVAILABLE
+        return None if _shared_keys is _UNAVAILABLE else _shared_keys
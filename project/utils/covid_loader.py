@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from .schema import COVID_SCHEMA, coerce_column
+
+
+# Columns the merge pipelines keep from the OWID "latest" snapshot
+COVID_COLUMNS = [
+    "iso_country_code", "continent", "location", "last_updated_date",
+    "total_cases", "new_cases", "total_deaths", "new_deaths",
+    "total_cases_per_million", "total_deaths_per_million", "hosp_patients"
+]
+
+
+# Builds the COVID frame from the OWID {code: {field: value}} mapping in one pass per
+# selected column, instead of one json_normalize frame per country plus a concat.
+# Non-dict entries are skipped and each column is coerced to its dtype in the schema (float64 if undeclared).
+# The country code goes into code_column (None drops it); columns missing from every record are left out.
+def covid_frame(covid_json: dict, columns: list = COVID_COLUMNS, code_column: str = "iso_country_code", schema: dict = COVID_SCHEMA):
+    codes = [code for code, record in covid_json.items() if isinstance(record, dict)]
+    records = [covid_json[code] for code in codes]
+    present = set().union(*records) if records else set()
+
+    data = {}
+    for col in columns:
+        if col == code_column:
+            data[col] = coerce_column(codes, schema.get(col, "string"))
+        elif col in present:
+            data[col] = coerce_column([record.get(col) for record in records], schema.get(col, "float64"))
+    return pd.DataFrame(data)
+
+
+def load_covid_file(file_path: str, columns: list = COVID_COLUMNS, code_column: str = "iso_country_code", schema: dict = COVID_SCHEMA):
+    with open(file_path, "r", encoding="utf-8") as f:
+        return covid_frame(json.load(f), columns, code_column, schema)
+
+
+# Positions of the n largest (or smallest) values, best first, without sorting the whole column.
+# Missing values rank last; ties keep their original order, like a stable sort would.
+def select_positions(values, n: int, largest: bool = True):
+    keys = np.asarray(values, dtype="float64")
+    keys = np.where(np.isnan(keys), np.inf, -keys if largest else keys)
+    n = min(n, len(keys))
+    if n <= 0:
+        return np.array([], dtype="int64")
+    if n < len(keys):
+        kth = np.partition(keys, n - 1)[n - 1]
+        candidates = np.flatnonzero(keys <= kth)
+    else:
+        candidates = np.arange(len(keys))
+    return candidates[np.argsort(keys[candidates], kind="stable")][:n]
+
+
+# The COVID file parsed once and shared by every pipeline step.
+# frame holds all COVID_COLUMNS; countries() drops the OWID aggregates (no continent).
+class CovidSnapshot:
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+
+    @classmethod
+    def from_file(cls, file_path: str):
+        return cls(load_covid_file(file_path))
+
+    def countries(self):
+        return self.frame[self.frame["continent"].notna()].reset_index(drop=True)
+
+    def top(self, n: int, column: str = "total_deaths", countries_only: bool = True):
+        frame = self.countries() if countries_only else self.frame
+        return frame.iloc[select_positions(frame[column].to_numpy(dtype="float64", na_value=np.nan), n)]
+
+    def bottom(self, n: int, column: str = "total_deaths", countries_only: bool = True):
+        frame = self.countries() if countries_only else self.frame
+        return frame.iloc[select_positions(frame[column].to_numpy(dtype="float64", na_value=np.nan), n, largest=False)]
+
+    def top_locations(self, n: int, column: str = "total_deaths"):
+        return self.top(n, column)["location"].astype(str).to_list()
@@ -0,0 +1,129 @@
+import os
+import json
+import hashlib
+import threading
+from urllib.parse import urlsplit, unquote
+
+import requests
+
+from .http_client import http_get
+
+
+CHUNK_SIZE = 1 << 16
+
+_shared_mirror = None
+_shared_lock = threading.Lock()
+
+
+# Keeps a local copy of each remote dataset next to its ETag/Last-Modified.
+# - a complete copy is revalidated with If-None-Match/If-Modified-Since; 304 serves it from disk
+# - downloads go to a .part file; an interrupted transfer resumes with Range + If-Range
+# - if the remote cannot be reached but a copy exists, the copy is served
+class DatasetMirror:
+    def __init__(self, directory: str = "data_mirror", max_resumes: int = 3):
+        self.directory = directory
+        self.max_resumes = max_resumes
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("DATASET_MIRROR_DIR", "data_mirror"))
+
+    def path_for(self, url: str):
+        name = unquote(os.path.basename(urlsplit(url).path)) or "index"
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:10]
+        return os.path.join(self.directory, f"{digest}_{name}")
+
+    def _url_lock(self, url: str):
+        with self._lock:
+            return self._locks.setdefault(url, threading.Lock())
+
+    def _read_meta(self, path: str):
+        try:
+            with open(f"{path}.meta.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, path: str, meta: dict):
+        with open(f"{path}.meta.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(f"{path}.meta.json.tmp", f"{path}.meta.json")
+
+    def _request_headers(self, path: str, meta: dict):
+        part = f"{path}.part"
+        partial_validator = meta.get("partial_etag") or meta.get("partial_last_modified")
+        if os.path.exists(part) and partial_validator:
+            return {"Range": f"bytes={os.path.getsize(part)}-", "If-Range": partial_validator}
+
+        headers = {}
+        if os.path.exists(path):
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    # Makes sure the local copy of url is current and returns its path.
+    def fetch(self, url: str):
+        path = self.path_for(url)
+        part = f"{path}.part"
+
+        with self._url_lock(url):
+            for attempt in range(self.max_resumes + 1):
+                meta = self._read_meta(path)
+                headers = self._request_headers(path, meta)
+                try:
+                    with http_get(url, headers=headers, stream=True) as response:
+                        if response.status_code == 304:
+                            return path
+                        offset = os.path.getsize(part) if os.path.exists(part) else 0
+                        if response.status_code == 416 or (response.status_code == 206 and not
+                                response.headers.get("Content-Range", "").startswith(f"bytes {offset}-")):
+                            # The partial file does not line up with the remote any more; start over
+                            os.remove(part)
+                            continue
+                        response.raise_for_status()
+
+                        resuming = response.status_code == 206
+                        meta["partial_etag"] = response.headers.get("ETag")
+                        meta["partial_last_modified"] = response.headers.get("Last-Modified")
+                        self._write_meta(path, meta)
+
+                        with open(part, "ab" if resuming else "wb") as f:
+                            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                                f.write(chunk)
+                except requests.exceptions.RequestException as e:
+                    if attempt < self.max_resumes and os.path.exists(part):
+                        print(f" Download of {url} interrupted ({e}), resuming...")
+                        continue
+                    if os.path.exists(path):
+                        print(f" Could not refresh {url} ({e}), using local copy.")
+                        return path
+                    raise
+
+                os.replace(part, path)
+                self._write_meta(path, {
+                    "url": url,
+                    "etag": meta.pop("partial_etag", None),
+                    "last_modified": meta.pop("partial_last_modified", None),
+                    "size": os.path.getsize(path),
+                })
+                return path
+
+            raise requests.exceptions.RetryError(f"Could not download {url} after {self.max_resumes + 1} attempts")
+
+    def load_json(self, url: str):
+        with open(self.fetch(url), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+# Returns the process-wide dataset mirror, configured from env settings on first use.
+def shared_mirror() -> DatasetMirror:
+    global _shared_mirror
+    with _shared_lock:
+        if _shared_mirror is None:
+            _shared_mirror = DatasetMirror.from_env()
+        return _shared_mirror
@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+# Console lines keep the leading space of the pipeline's print output
+CONSOLE_FORMAT = " %(message)s"
+FILE_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+_log_queue = None
+_listener = None
+_configure_lock = threading.Lock()
+
+
+# Hands records to the listener thread as they are. The stock QueueHandler formats each
+# message in the calling thread first, which is exactly the work hot loops should not do;
+# records only cross threads here, never processes, so they need no preparing.
+class _RecordQueueHandler(QueueHandler):
+    def prepare(self, record):
+        return record
+
+
+# Routes every logger under "etl" through one queue. A background listener thread
+# writes the console (level LOG_LEVEL, default INFO) and, when LOG_FILE is set
+# (default etl.log, empty turns it off), a rotating file at LOG_FILE_LEVEL (default
+# DEBUG) of LOG_MAX_BYTES per file with LOG_BACKUPS old files kept. Callers only put
+# records on the queue, so they never wait on a terminal or disk. Safe to call more
+# than once; only the first call configures anything.
+def configure_logging(level: str = None, log_file: str = None, file_level: str = None):
+    global _log_queue, _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+        log_file = log_file if log_file is not None else os.getenv("LOG_FILE", "etl.log")
+        file_level = (file_level or os.getenv("LOG_FILE_LEVEL", "DEBUG")).upper()
+
+        console = logging.StreamHandler(sys.stdout)
+        console.setLevel(level)
+        console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        handlers = [console]
+        if log_file:
+            directory = os.path.dirname(log_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            file_handler = RotatingFileHandler(
+                log_file,
+                maxBytes=int(os.getenv("LOG_MAX_BYTES", str(5 * 1024 * 1024))),
+                backupCount=int(os.getenv("LOG_BACKUPS", "3")),
+                encoding="utf-8",
+                delay=True,
+            )
+            file_handler.setLevel(file_level)
+            file_handler.setFormatter(logging.Formatter(FILE_FORMAT))
+            handlers.append(file_handler)
+
+        _log_queue = queue.Queue()
+        root = logging.getLogger("etl")
+        root.addHandler(_RecordQueueHandler(_log_queue))
+        # The logger lets through what at least one handler wants; the rest is dropped before a record is made
+        root.setLevel(min(handler.level for handler in handlers))
+        root.propagate = False
+
+        _listener = QueueListener(_log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+# Returns the logger for one part of the pipeline, configuring logging on first use.
+def get_logger(name: str) -> logging.Logger:
+    configure_logging()
+    return logging.getLogger(f"etl.{name}")
+
+
+# Blocks until every record queued so far has been written. Called at the end of a
+# loop, so later print() output does not overtake its log lines on the console.
+def flush_logging():
+    if _log_queue is not None:
+        _log_queue.join()
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+# Replaces one console line per item with a summary every `every` items or every
+# `interval` seconds, whichever comes first: done/total, failures, throughput and ETA.
+# Defaults come from LOG_PROGRESS_EVERY (500) and LOG_PROGRESS_SECONDS (10).
+# update() is thread-safe and, between summaries, only bumps counters under a lock.
+class ProgressLogger:
+    def __init__(self, logger: logging.Logger, total: int, label: str, every: int = None, interval: float = None):
+        self.logger = logger
+        self.total = total
+        self.label = label
+        self.every = every or int(os.getenv("LOG_PROGRESS_EVERY", "500"))
+        self.interval = interval if interval is not None else float(os.getenv("LOG_PROGRESS_SECONDS", "10"))
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self._last_done = 0
+        self._lock = threading.Lock()
+
+    def update(self, count: int = 1, failed: bool = False):
+        with self._lock:
+            self.done += count
+            if failed:
+                self.failed += count
+            now = time.monotonic()
+            if self.done - self._last_done < self.every and now - self._last_report < self.interval:
+                return
+            self._last_report = now
+            self._last_done = self.done
+            done, failed_count = self.done, self.failed
+        self._log(done, failed_count, now)
+
+    def _log(self, done: int, failed: int, now: float):
+        elapsed = max(now - self.started, 1e-9)
+        rate = done / elapsed
+        eta = _format_duration((self.total - done) / rate) if rate > 0 and done < self.total else "-"
+        self.logger.info("%s: %d/%d done, %d failed, %.1f/s, elapsed %s, ETA %s",
+                         self.label, done, self.total, failed, rate, _format_duration(elapsed), eta)
+
+    # Logs the final summary, unless the last update just did, and waits for it to reach the console.
+    def close(self):
+        with self._lock:
+            done, failed = self.done, self.failed
+            reported = self._last_done == done and done > 0
+        if not reported:
+            self._log(done, failed, time.monotonic())
+        flush_logging()
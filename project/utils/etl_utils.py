@@ -10,146 +10,379 @@ except ImportError:
     import openpyxl
 
 import os
-import json
+import time
+import shutil
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 
-import requests
 import pandas as pd
 import numpy as np
 
+from .weather_fetch import DEFAULT_CONCURRENCY, fetch_weather_results
+from .weather_batch import fetch_weather_batched
+from .spatial_dedupe import cluster_cities
+from .rate_limiter import shared_limiter
+from .http_client import http_get
+from .json_stream import iter_json_array
+from .covid_loader import CovidSnapshot
+from .schema import WEATHER_SCHEMA, apply_schema, align_categories
+from .weather_cache import shared_cache, url_namespace, city_key, coord_key, id_key, is_cacheable
+from .city_index import shared_index
+from .checkpoint import HarvestJournal
+from .excel_stream import write_excel_stream
+from .country_keys import shared_country_keys
+from .hedging import shared_policy
+from .etl_logging import get_logger, ProgressLogger
+
 
 load_dotenv()
 
+# Point this at a local stand-in (utils/openweather_stub.py) to test without the real API
+WEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+
+# One limiter shared by every OpenWeather call in this run
+weather_limiter = shared_limiter("openweather")
+# Responses are reused across runs until they are older than WEATHER_CACHE_TTL; answers
+# from a stand-in are cached apart from real ones
+weather_cache = shared_cache("openweather", url_namespace(WEATHER_BASE_URL))
+# Remembers how each city was resolved so later runs need exactly one request per city
+city_index = shared_index("openweather", url_namespace(WEATHER_BASE_URL))
+# Times every weather request and, with WEATHER_HEDGE=1, backs up the slowest ones
+weather_hedge = shared_policy("openweather")
+# Queued logging: per-city detail goes to the log file, the console gets progress summaries
+logger = get_logger("etl_utils")
+
 
 ## Extracting data
-def extract_covid(file_path: str):
-    with open(file_path, "r") as f:
-        response = json.load(f)
-    covid_country_df = pd.DataFrame(response).T
-    covid_country_df.reset_index(inplace=True)
-    covid_country_df.rename(columns={'index': 'country_code'}, inplace=True)
-    covid_country_df = covid_country_df[["continent", "location", "total_cases", "new_cases", "total_deaths", "new_deaths", "total_cases_per_million", "total_deaths_per_million"]]
+COVID_SELECTED_COLUMNS = ["continent", "location", "total_cases", "new_cases", "total_deaths", "new_deaths", "total_cases_per_million", "total_deaths_per_million"]
+
+# Accepts the path of the COVID JSON file or an already loaded CovidSnapshot
+# Adds the canonical ISO3 key used by transform_final_df when the country lookup is available
+# (country_keys, by default the shared lookup)
+def extract_covid(source, country_keys=None):
+    snapshot = source if isinstance(source, CovidSnapshot) else CovidSnapshot.from_file(source)
+    covid_country_df = snapshot.frame[COVID_SELECTED_COLUMNS]
+    country_keys = country_keys or shared_country_keys()
+    if country_keys is not None:
+        covid_country_df = covid_country_df.assign(ISO3=country_keys.from_iso3(snapshot.frame['iso_country_code']))
     return covid_country_df
 
 
 
-def extract_cities(url: str, target_countries: list):
-    response = requests.get(url).json()
+CITY_COLUMNS = ['city', 'country_code', 'country_name', 'state', 'latitude', 'longitude']
+
+def build_city_record(city: dict):
+    return {
+        'city': city.get('name', np.nan),
+        'country_code': city.get('country_code', np.nan),
+        'country_name': city.get('country_name', np.nan),
+        'state': city.get('state_name', np.nan),
+        'latitude': city.get('latitude', np.nan),
+        'longitude': city.get('longitude', np.nan)
+    }
+
+# Parses the cities array straight off the response body, keeping only the target
+# countries and hanging up as soon as every country has per_country cities.
+def stream_cities(url: str, target_countries: list, per_country: int = None):
+    counts = {country: 0 for country in target_countries}
+    unfilled = len(counts)
     raw_cities = []
 
-    for city in response:
-        if city.get('country_name') in target_countries:
-            raw_cities.append({
-                'city': city.get('name', np.nan),
-                'country_code': city.get('country_code', np.nan),
-                'country_name': city.get('country_name', np.nan),
-                'state': city.get('state_name', np.nan),
-                'latitude': city.get('latitude', np.nan),
-                'longitude': city.get('longitude', np.nan)
-            })
-
-    cities_df = pd.DataFrame(raw_cities)
-    top_cities = cities_df.groupby('country_name').head(10).reset_index(drop=True)
+    with http_get(url, stream=True) as response:
+        response.raise_for_status()
+        for city in iter_json_array(response.iter_content(chunk_size=1 << 16)):
+            country = city.get('country_name')
+            if country not in counts or (per_country is not None and counts[country] >= per_country):
+                continue
+            raw_cities.append(build_city_record(city))
+            counts[country] += 1
+            if per_country is not None and counts[country] == per_country:
+                unfilled -= 1
+                if unfilled == 0:
+                    break
+
+    return raw_cities
+
+
+def extract_cities(url: str, target_countries: list, per_country: int = 10, stream: bool = True, country_keys=None):
+    if stream:
+        raw_cities = stream_cities(url, target_countries, per_country)
+    else:
+        response = http_get(url).json()
+        raw_cities = [build_city_record(city) for city in response if city.get('country_name') in target_countries]
+
+    cities_df = pd.DataFrame(raw_cities, columns=CITY_COLUMNS)
+    if per_country is not None:
+        cities_df = cities_df.groupby('country_name').head(per_country)
+    top_cities = cities_df.reset_index(drop=True)
+    country_keys = country_keys or shared_country_keys()
+    if country_keys is not None:
+        top_cities['ISO3'] = country_keys.from_iso2(top_cities['country_code'])
     return top_cities
 
 
-def extract_weather_by_city(city: str):
-    params = {'q':city, 'appid': os.getenv('WEATHER_KEY'), 'units':'metric'}
-    response = requests.get("https://api.openweathermap.org/data/2.5/weather", params=params).json()
-    return response
+def get_weather_json(endpoint: str, params: dict):
+    params = {**params, 'appid': os.getenv('WEATHER_KEY'), 'units': 'metric'}
+    return http_get(f"{WEATHER_BASE_URL}/{endpoint}", params=params, limiter=weather_limiter).json()
 
-def extract_weather_by_coord(lat: float, lon: float):
-    params = {'lat':lat, 'lon':lon, 'appid':os.getenv('WEATHER_KEY'), 'units':'metric'}
-    response = requests.get("https://api.openweathermap.org/data/2.5/weather", params=params).json()
+# A fresh by-name or by-coordinate answer is cached under its location ID as well: once the
+# city index knows the ID, the next run asks by ID and should find it cached too
+def get_weather_json_by_id_too(params: dict):
+    response = get_weather_json('weather', params)
+    if is_cacheable(response) and response.get('id'):
+        weather_cache.set(id_key(response['id']), response)
     return response
 
-def extract_weather_data(desired_cities_df: pd.DataFrame):
-    weather_data = []
-    cities_wo_data = []
-    desired_cities_df = desired_cities_df.to_dict(orient='records')
+def extract_weather_by_city(city: str):
+    fetch = lambda: get_weather_json_by_id_too({'q': city})
+    return weather_cache.get_or_fetch(city_key(city), fetch)
 
-    print(f" Total cities to process: {len(desired_cities_df)}\n")
-    
-    for idx, city in enumerate(desired_cities_df, start=1):
-        print(f" [{idx}/{len(desired_cities_df)}] Fetching weather by city: {city['city']}")
-        w_data = extract_weather_by_city(city['city'])
-
-        if w_data.get('cod') != 200 or 'weather' not in w_data:
-            print(f" Skipping city: {city['city']} — Reason: {w_data.get('message', 'No message')}")
-            cities_wo_data.append(city)
-            continue
-
-        weather = {
-            'City': city['city'],
-            'Country': city['country_name'],
-            'State': city['state'],
-            'Latitude': city['latitude'],
-            'Longitude': city['longitude'],
-            'Condition': w_data['weather'][0]['description'],
-            'Min_Temperature': w_data['main']['temp_min'],
-            'Max_Temperature': w_data['main']['temp_max']
-        }
-        weather_data.append(weather)
+def extract_weather_by_coord(lat: float, lon: float):
+    fetch = lambda: get_weather_json_by_id_too({'lat': lat, 'lon': lon})
+    return weather_cache.get_or_fetch(coord_key(lat, lon), fetch)
+
+def extract_weather_by_id(owm_id: int):
+    fetch = lambda: get_weather_json('weather', {'id': owm_id})
+    return weather_cache.get_or_fetch(id_key(owm_id), fetch)
+
+def build_weather_record(city: dict, response: dict):
+    return {
+        'City': city['city'],
+        'Country': city['country_name'],
+        'State': city['state'],
+        'Latitude': city['latitude'],
+        'Longitude': city['longitude'],
+        'Condition': response['weather'][0]['description'],
+        'Min_Temperature': response['main']['temp_min'],
+        'Max_Temperature': response['main']['temp_max'],
+        'ISO3': city.get('ISO3')
+    }
+
+# With journal_path set, every city fetched is checkpointed there and a rerun after a crash
+# skips the cities already done; failed cities are not journaled, so the rerun tries them
+# again. The journal is removed once the harvest completes.
+def extract_weather_data(desired_cities_df: pd.DataFrame, concurrency: int = DEFAULT_CONCURRENCY, batch: bool = False,
+                         dedupe_radius_km: float = None, journal_path: str = None):
+    desired_cities_df = desired_cities_df.to_dict(orient='records')
 
-    print(f"\n Weather data fetched by city for {len(weather_data)} cities.")
-    print(f" Trying coordinates for remaining {len(cities_wo_data)} cities...\n")
+    print(f" Total cities to process: {len(desired_cities_df)} (up to {concurrency} requests in flight)\n")
+
+    # Cities within dedupe_radius_km of each other share one lookup
+    if dedupe_radius_km:
+        representative = cluster_cities(desired_cities_df, dedupe_radius_km)
+    else:
+        representative = list(range(len(desired_cities_df)))
+    to_fetch = sorted(set(representative))
+    if dedupe_radius_km:
+        print(f" Spatial dedupe ({dedupe_radius_km} km): {len(to_fetch)} lookups for {len(desired_cities_df)} cities, "
+              f"{len(desired_cities_df) - len(to_fetch)} calls saved.")
+
+    # (source, response) per fetched position; batched answers count as by-city hits
+    results = {}
+    journal = HarvestJournal(journal_path) if journal_path else None
+    if journal is not None:
+        keys = {pos: city_index.key(desired_cities_df[pos]) for pos in to_fetch}
+        results = {pos: journal.get(keys[pos]) for pos in to_fetch if keys[pos] in journal}
+        to_fetch = [pos for pos in to_fetch if pos not in results]
+        if results:
+            print(f" Resuming from {journal_path}: {len(results)} cities already done, {len(to_fetch)} to go.")
+
+    progress = ProgressLogger(logger, len(to_fetch), "Weather")
+
+    def checkpoint(city: dict, source, response: dict):
+        if journal is not None and source is not None:
+            journal.record(city_index.key(city), source, response)
+        progress.update(failed=source is None)
+
+    if batch:
+        # Cities resolved on an earlier run can go into /group batches by their location ID
+        batch_cities = [desired_cities_df[pos] for pos in to_fetch]
+        for city in batch_cities:
+            entry = city_index.lookup(city)
+            city['owm_id'] = entry.owm_id if entry is not None else None
+        batched, leftovers = fetch_weather_batched(batch_cities, get_weather_json)
+        for sub_pos, response in batched.items():
+            results[to_fetch[sub_pos]] = ('city', response)
+            checkpoint(batch_cities[sub_pos], 'city', response)
+        logger.info("Weather data fetched in batches for %d cities, %d left for single requests.", len(batched), len(leftovers))
+        to_fetch = [to_fetch[sub_pos] for sub_pos in leftovers]
+
+    single_results = fetch_weather_results([desired_cities_df[pos] for pos in to_fetch], extract_weather_by_city, extract_weather_by_coord,
+                                           concurrency, city_index, extract_weather_by_id, checkpoint, weather_hedge)
+    results.update(zip(to_fetch, single_results))
+    progress.close()
+    if journal is not None:
+        journal.complete()
 
-    weather_df1 = pd.json_normalize(weather_data, max_level=1)
+    weather_data = []
     weather_data_coord = []
+    for pos, city in enumerate(desired_cities_df):
+        source, response = results.get(representative[pos], (None, None))
+        if source == 'city':
+            weather_data.append(build_weather_record(city, response))
+        elif source == 'coord':
+            weather_data_coord.append(build_weather_record(city, response))
 
-    for idx, city in enumerate(cities_wo_data, start=1):
-        lat = city['latitude']
-        lon = city['longitude']
-        print(f" [{idx}/{len(cities_wo_data)}] Fetching weather by coordinates: {city['city']} ({lat}, {lon})")
-        response = extract_weather_by_coord(lat, lon)
-
-        if response.get('cod') != 200 or 'weather' not in response:
-            print(f" Failed to get weather by coord for {city['city']} — Reason: {response.get('message', 'No message')}")
-            continue
-
-        weather = {
-            'City': city['city'],
-            'Country': city['country_name'],
-            'State': city['state'],
-            'Latitude': city['latitude'],
-            'Longitude': city['longitude'],
-            'Condition': response['weather'][0]['description'],
-            'Min_Temperature': response['main']['temp_min'],
-            'Max_Temperature': response['main']['temp_max']
-        }
-        weather_data_coord.append(weather)
-
-    print(f"\n Weather data fetched by coordinates for {len(weather_data_coord)} cities.")
+    print(f"\n Weather data fetched by city for {len(weather_data)} cities.")
+    print(f" Weather data fetched by coordinates for {len(weather_data_coord)} cities.")
 
+    weather_df1 = pd.json_normalize(weather_data, max_level=1)
     weather_df2 = pd.json_normalize(weather_data_coord, max_level=1)
     weather_df = pd.concat([weather_df1, weather_df2], axis=0, ignore_index=True)
+    weather_df = apply_schema(weather_df, WEATHER_SCHEMA)
 
     print(f"\n Total weather records collected: {len(weather_df)}")
+    print(f" OpenWeather rate limiter: {weather_limiter.stats()}")
+    print(f" City index: {city_index.stats()}")
+    print(f" Per-city latency: {weather_hedge.stats()}")
     return weather_df
 
 ## Transforming data
 def transform_final_df(covid_df: pd.DataFrame, weather_df: pd.DataFrame):
-    final_df = covid_df.merge(weather_df, how='inner', left_on='location', right_on='Country')
+    # Shared categories let the merge join on category codes instead of strings
+    covid_df = covid_df.copy()
+    weather_df = weather_df.copy()
+    if 'ISO3' in covid_df.columns and 'ISO3' in weather_df.columns:
+        # Both sides carry the ISO3 key, so spelling differences in country names do not matter
+        left_key, right_key = 'ISO3', 'ISO3'
+        covid_df['ISO3'], weather_df['ISO3'] = align_categories(covid_df['ISO3'].astype('category'), weather_df['ISO3'].astype('category'))
+    else:
+        left_key, right_key = 'location', 'Country'
+        covid_df['location'], weather_df['Country'] = align_categories(covid_df['location'], weather_df['Country'])
+
+    unmatched = ~weather_df[right_key].isin(covid_df[left_key].dropna())
+    if unmatched.any():
+        print(f" {int(unmatched.sum())} weather rows have no COVID match on {right_key} and are dropped: {sorted(weather_df.loc[unmatched, 'Country'].astype(str).unique())}")
+
+    # pandas would pair up missing keys with each other, so rows without a key are left out.
+    # The large weather frame goes on the left so the join keeps its row order instead of
+    # reshuffling every row into COVID order.
+    covid_df = covid_df[covid_df[left_key].notna()]
+    final_df = weather_df[~unmatched].merge(covid_df, how='inner', left_on=right_key, right_on=left_key)
     final_df.drop(columns=['location'], inplace=True)
     final_df = final_df[['Country','continent', 'City', 'State', 'Latitude', 'Longitude', 'Condition', 'Min_Temperature', 'Max_Temperature', 'total_cases', 'new_cases', 'total_deaths', 'new_deaths', 'total_cases_per_million', 'total_deaths_per_million']]
     return final_df
 
 ## Loading data
+COORDINATE_COLUMNS = ['Latitude', 'Longitude']
+
+# The 2-decimal float_format of the CSV and Excel files is meant for the measures.
+# Coordinates keep the 8 decimals of the cities dataset instead of being cut to ~1 km,
+# written as text like the source values were.
+def _coordinates_as_text(final_df: pd.DataFrame):
+    columns = [column for column in COORDINATE_COLUMNS if column in final_df.columns and pd.api.types.is_float_dtype(final_df[column])]
+    return final_df.assign(**{column: final_df[column].map("{:.8f}".format).where(final_df[column].notna()) for column in columns})
+
 def load_to_csv(final_df: pd.DataFrame, table_name: str):
+    final_df = _coordinates_as_text(final_df)
     final_df.to_csv(f"{table_name}.csv", index=False, float_format="%.2f", na_rep="N/A")
     print(f" {table_name}.csv saved successfully.")
 
 
-def load_to_excel(final_df: pd.DataFrame, table_name: str):
+# streaming=True writes through a write-only workbook in constant memory and rolls over
+# to Data_2, Data_3, ... past Excel's row limit; False builds the whole sheet with pandas.
+def load_to_excel(final_df: pd.DataFrame, table_name: str, streaming: bool = True):
     excel_file = f"{table_name}.xlsx"
+    final_df = _coordinates_as_text(final_df)
+    if streaming:
+        sheets = write_excel_stream(final_df, excel_file, sheet_name="Data", float_format="%.2f", na_rep="N/A")
+        print(f" {excel_file} saved successfully in structured Excel format ({sheets} sheet{'s' if sheets > 1 else ''}).")
+        return
     with pd.ExcelWriter(excel_file, engine='openpyxl') as writer:
         final_df.to_excel(writer, sheet_name="Data", index=False, float_format="%.2f", na_rep="N/A")
     print(f" {excel_file} saved successfully in structured Excel format.")
 
 
-def load_to_files(final_df: pd.DataFrame, table_name: str):
-    print("\n Saving to CSV...")
-    load_to_csv(final_df, table_name)
-
-    print("\n Saving to Excel...")
-    load_to_excel(final_df, table_name)
+# Directory of the partitioned dataset is <table_name>_<format>, laid out as
+# continent=<...>/Country=<...>/part-0.<ext> so readers can skip whole partitions.
+COLUMNAR_PARTITION_COLUMNS = ['continent', 'Country']
+COLUMNAR_COMPRESSION = "zstd"
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        print(" 'pyarrow' not found. Installing now...")
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "pyarrow"])
+
+
+# Writes final_df as a partitioned Parquet ('parquet') or Feather / Arrow IPC ('feather') dataset.
+# String columns are dictionary encoded and every file is compressed. The dataset is written
+# next to the old one and swapped in, so like the CSV and Excel files it holds exactly
+# final_df: partitions of countries no longer in the data do not linger.
+def load_to_columnar(final_df: pd.DataFrame, table_name: str, file_format: str = "parquet",
+                     partition_cols: list = COLUMNAR_PARTITION_COLUMNS, compression: str = COLUMNAR_COMPRESSION):
+    _require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    if file_format == "parquet":
+        data_format = ds.ParquetFileFormat()
+        file_options = data_format.make_write_options(compression=compression, use_dictionary=True)
+    elif file_format == "feather":
+        data_format = ds.IpcFileFormat()
+        file_options = data_format.make_write_options(compression=compression)
+    else:
+        raise ValueError(f"Unknown columnar format: {file_format}")
+
+    # Partition values end up in directory names, so they are written as plain strings
+    partitioned_df = final_df.astype({column: object for column in partition_cols})
+    table = pa.Table.from_pandas(partitioned_df, preserve_index=False)
+    for position, field in enumerate(table.schema):
+        if field.name not in partition_cols and pa.types.is_string(field.type):
+            table = table.set_column(position, field.name, pc.dictionary_encode(table.column(position)))
+
+    directory = f"{table_name}_{file_format}"
+    temp_directory = f"{directory}.tmp-{os.getpid()}"
+    old_directory = f"{directory}.old-{os.getpid()}"
+    shutil.rmtree(temp_directory, ignore_errors=True)
+    ds.write_dataset(table, temp_directory, format=data_format, file_options=file_options, partitioning=partition_cols,
+                     partitioning_flavor="hive")
+    if os.path.exists(directory):
+        os.rename(directory, old_directory)
+    os.rename(temp_directory, directory)
+    shutil.rmtree(old_directory, ignore_errors=True)
+    print(f" {directory}/ saved successfully, partitioned by {', '.join(partition_cols)}.")
+
+
+FILE_LOADERS = {
+    'csv': load_to_csv,
+    'xlsx': load_to_excel,
+    'parquet': partial(load_to_columnar, file_format="parquet"),
+    'feather': partial(load_to_columnar, file_format="feather"),
+}
+
+# Below this many rows the formats are written one after the other in this process:
+# starting the worker processes (each imports pandas and this module) takes about two
+# seconds, more than writing a small frame in every format.
+LOAD_POOL_MIN_ROWS = int(os.getenv("LOAD_POOL_MIN_ROWS", "200000"))
+
+def _timed_load(final_df: pd.DataFrame, table_name: str, file_format: str):
+    started = time.perf_counter()
+    FILE_LOADERS[file_format](final_df, table_name)
+    return time.perf_counter() - started
+
+
+# Writes every requested format of a frame of at least pool_min_rows rows at the same
+# time, so the total takes about as long as the slowest format instead of the sum of all
+# of them; smaller frames are written inline. The CSV and Excel writers are
+# pure Python and hold the GIL, so each format gets its own worker process. The workers
+# are spawned, not forked: the pipeline has stage, logging and SQLite threads running, and
+# a forked child could hang on a lock one of them held at the time of the fork.
+def load_to_files(final_df: pd.DataFrame, table_name: str, formats: list = ('csv', 'xlsx'), pool_min_rows: int = LOAD_POOL_MIN_ROWS):
+    unknown = [file_format for file_format in formats if file_format not in FILE_LOADERS]
+    if unknown:
+        raise ValueError(f"Unknown output formats: {unknown} (choose from {list(FILE_LOADERS)})")
+
+    print(f"\n Saving to {', '.join(formats)}...")
+    started = time.perf_counter()
+    if len(formats) == 1 or len(final_df) < pool_min_rows:
+        timings = {file_format: _timed_load(final_df, table_name, file_format) for file_format in formats}
+    else:
+        with ProcessPoolExecutor(max_workers=len(formats), mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {file_format: executor.submit(_timed_load, final_df, table_name, file_format) for file_format in formats}
+            timings = {file_format: future.result() for file_format, future in futures.items()}
+    print(f" Files written in {time.perf_counter() - started:.2f}s ({', '.join(f'{name} {seconds:.2f}s' for name, seconds in timings.items())}).")
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+
+# Rows per sheet including the header, Excel's hard limit
+EXCEL_MAX_ROWS = 1048576
+
+# Rows converted to cell values at a time; bounds the memory of the conversion
+EXCEL_CHUNK_ROWS = 10000
+
+_THIN = Side(style="thin")
+_HEADER_FONT = Font(bold=True)
+_HEADER_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+_HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="top")
+
+
+def _format_float(value: float, float_format: str):
+    if np.isinf(value):
+        return "inf" if value > 0 else "-inf"
+    return float(float_format % value) if float_format else value
+
+
+# Cell values for one column, following DataFrame.to_excel: floats go through
+# float_format and are stored as numbers, missing values become na_rep.
+def _cell_values(series: pd.Series, float_format: str, na_rep: str) -> list:
+    missing = series.isna().to_numpy()
+    values = series.astype(object).tolist()
+    if pd.api.types.is_float_dtype(series.dtype):
+        values = [_format_float(value, float_format) if not is_missing else value for value, is_missing in zip(values, missing)]
+    return [na_rep if is_missing else value for value, is_missing in zip(values, missing)]
+
+
+def _header_row(sheet, columns: list):
+    row = []
+    for column in columns:
+        cell = WriteOnlyCell(sheet, value=str(column))
+        cell.font = _HEADER_FONT
+        cell.border = _HEADER_BORDER
+        cell.alignment = _HEADER_ALIGNMENT
+        row.append(cell)
+    return row
+
+
+# Writes df to an .xlsx file through a write-only workbook, which streams rows to
+# disk instead of keeping a cell object for every value in memory.
+# Rows that do not fit on one sheet continue on sheet_name_2, sheet_name_3, ...,
+# each starting with the header row. Returns the number of sheets written.
+def write_excel_stream(df: pd.DataFrame, path: str, sheet_name: str = "Data", float_format: str = None,
+                       na_rep: str = "", chunk_rows: int = EXCEL_CHUNK_ROWS, max_rows: int = EXCEL_MAX_ROWS):
+    workbook = Workbook(write_only=True)
+    columns = list(df.columns)
+    rows_per_sheet = max_rows - 1
+    sheet = None
+    sheet_rows = rows_per_sheet
+    sheets = 0
+
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        cell_columns = [_cell_values(chunk.iloc[:, position], float_format, na_rep) for position in range(chunk.shape[1])]
+        for row in zip(*cell_columns):
+            if sheet_rows == rows_per_sheet:
+                sheets += 1
+                sheet = workbook.create_sheet(sheet_name if sheets == 1 else f"{sheet_name}_{sheets}")
+                sheet.append(_header_row(sheet, columns))
+                sheet_rows = 0
+            sheet.append(row)
+            sheet_rows += 1
+
+    if sheet is None:
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(_header_row(sheet, columns))
+        sheets = 1
+    workbook.save(path)
+    return sheets
@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from .http_client import ExchangeLog, track_exchanges
+
+
+# Latencies kept for learning the hedge delay and for the per-city report
+LATENCY_WINDOW = 500
+CITY_LATENCY_WINDOW = 10000
+
+_shared_policies = {}
+_shared_lock = threading.Lock()
+
+
+# p50/p99 in milliseconds of a list of latencies given in seconds.
+def latency_summary(samples) -> dict:
+    if not samples:
+        return {'count': 0, 'p50_ms': None, 'p99_ms': None}
+    p50, p99 = np.percentile(np.asarray(samples), [50, 99]) * 1000
+    return {'count': len(samples), 'p50_ms': round(float(p50), 1), 'p99_ms': round(float(p99), 1)}
+
+
+# Decides when a slow request gets a backup copy.
+# The delay is the `percentile` of the request latencies seen so far in the run, so it
+# follows the provider as it speeds up or slows down. No hedge is sent until min_samples
+# requests have been timed, and hedges never exceed `budget` times the requests sent.
+# Per-city latencies are recorded whether hedging is on or off, so both can be compared.
+class HedgePolicy:
+    def __init__(self, enabled: bool = False, percentile: float = 95, budget: float = 0.1, min_samples: int = 20):
+        if not 0 < percentile < 100:
+            raise ValueError("percentile must be between 0 and 100")
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._city_latencies = deque(maxlen=CITY_LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prefix: str = "WEATHER"):
+        return cls(
+            enabled=os.getenv(f"{prefix}_HEDGE", "0") == "1",
+            percentile=float(os.getenv(f"{prefix}_HEDGE_PERCENTILE", "95")),
+            budget=float(os.getenv(f"{prefix}_HEDGE_BUDGET", "0.1")),
+            min_samples=int(os.getenv(f"{prefix}_HEDGE_MIN_SAMPLES", "20")),
+        )
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(seconds)
+
+    def observe_city(self, seconds: float):
+        with self._lock:
+            self._city_latencies.append(seconds)
+
+    # Seconds to wait on a request before hedging it, or None while hedging is off or still learning.
+    def delay(self):
+        if not self.enabled:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            return float(np.percentile(np.asarray(self._latencies), self.percentile))
+
+    # Takes one hedge out of the budget; False once the extra load would pass it.
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def record_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def stats(self):
+        with self._lock:
+            city_latencies = list(self._city_latencies)
+            hedges, wins = self.hedges, self.hedge_wins
+        return {'hedging': 'on' if self.enabled else 'off', 'hedges': hedges, 'hedge_wins': wins, **latency_summary(city_latencies)}
+
+
+# Calls func(*args) and, if it has not answered within the policy's delay, a second copy
+# of it; returns the first result accepted by `accept` (any result when neither is).
+# Only the HTTP exchanges func makes through http_get are timed, from the first one on:
+# waits for the rate limiter or a cache answer teach the policy nothing about the server.
+# The delay likewise counts from when the request went out, and the second copy skips the
+# limiter's in-flight window. A thread cannot be interrupted,
+# so the losing copy runs to completion in the background and its result is dropped.
+def hedged_call(policy: HedgePolicy, executor: ThreadPoolExecutor, func, *args, accept=lambda result: result is not None):
+    exchanges = ExchangeLog(policy.observe)
+
+    def timed(backup: bool = False):
+        with track_exchanges(exchanges, backup):
+            return func(*args)
+
+    primary = executor.submit(timed)
+    pending = {primary}
+    delay = timeout = policy.delay()
+    result = None
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                sent = exchanges.last_sent
+                on_wire = time.monotonic() - sent if sent is not None else 0.0
+                if on_wire < delay:
+                    timeout = delay - on_wire
+                    continue
+                timeout = None
+                if policy.try_hedge():
+                    pending.add(executor.submit(timed, True))
+                continue
+            for future in done:
+                if accept(future.result()):
+                    for other in pending:
+                        other.cancel()
+                    if future is not primary:
+                        policy.record_win()
+                    return future.result()
+                if future is primary:
+                    result = future.result()
+        return result
+    finally:
+        if exchanges.first_sent is not None:
+            policy.observe_city(time.monotonic() - exchanges.first_sent)
+
+
+# Returns the process-wide hedge policy, configured from env settings on first use.
+def shared_policy(name: str = "openweather") -> HedgePolicy:
+    with _shared_lock:
+        if name not in _shared_policies:
+            _shared_policies[name] = HedgePolicy.from_env()
+        return _shared_policies[name]
@@ -0,0 +1,177 @@
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .rate_limiter import THROTTLE_STATUSES, parse_retry_after
+from .telemetry import shared_telemetry
+
+
+# Status codes worth another attempt; anything else is returned to the caller as is
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Larger keep-alive pools for hosts we hit many times concurrently
+DEFAULT_HOST_POOL_SIZES = {
+    "api.openweathermap.org": 32,
+}
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+# Per thread: the ExchangeLog requests are timed into and whether they are hedge backups
+_tracking = threading.local()
+
+
+# Times the HTTP exchanges of one logical call, which may span several threads (a request
+# and its hedge). Only the time on the wire counts: the wait for the rate limiter and the
+# backoff between retries are left out, so hedge delays and latency percentiles describe
+# the server, not our own queue. observe(seconds) is called as each exchange finishes;
+# first_sent and last_sent are when the first and the latest went out (time.monotonic()),
+# None while none has.
+class ExchangeLog:
+    def __init__(self, observe=None):
+        self.observe = observe
+        self.first_sent = None
+        self.last_sent = None
+        self._lock = threading.Lock()
+
+    def sent(self, at: float):
+        with self._lock:
+            if self.first_sent is None or at < self.first_sent:
+                self.first_sent = at
+            if self.last_sent is None or at > self.last_sent:
+                self.last_sent = at
+
+    def done(self, seconds: float):
+        if self.observe:
+            self.observe(seconds)
+
+
+# Requests this thread makes inside the block are timed into log. With backup=True they are
+# hedge backups: they skip the rate limiter's in-flight window, which the requests they back
+# up are holding, but still take a token, so the request rate stays within the limiter's.
+@contextmanager
+def track_exchanges(log: ExchangeLog, backup: bool = False):
+    _tracking.log, _tracking.backup = log, backup
+    try:
+        yield
+    finally:
+        _tracking.log, _tracking.backup = None, False
+
+
+# Body size of a response; a streamed body has not been read yet, so its Content-Length is used.
+def _response_bytes(response: requests.Response, stream: bool) -> int:
+    if stream:
+        return int(response.headers.get('Content-Length') or 0)
+    return len(response.content)
+
+
+# One requests.Session shared by every extractor:
+# - keep-alive connection pooling, with a pool per host sized by host_pool_sizes
+# - (connect, read) timeouts on every request
+# - retries on connection errors, timeouts and RETRY_STATUSES with full-jitter
+#   exponential backoff, never waiting past total_budget seconds for one call
+# - an optional AdaptiveRateLimiter is consulted on every attempt
+# - every attempt's latency, status and size go to the Telemetry collector, if given
+class HttpClient:
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 30, max_retries: int = 4,
+                 backoff_base: float = 0.5, backoff_cap: float = 10, total_budget: float = 60,
+                 pool_size: int = 10, host_pool_sizes: dict = None, telemetry=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.total_budget = total_budget
+        self.retries = 0
+        self.telemetry = telemetry
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        default_adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", default_adapter)
+        self.session.mount("http://", default_adapter)
+        for host, size in (host_pool_sizes if host_pool_sizes is not None else DEFAULT_HOST_POOL_SIZES).items():
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size, max_retries=0)
+            self.session.mount(f"https://{host}", adapter)
+            self.session.mount(f"http://{host}", adapter)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "30")),
+            max_retries=int(os.getenv("HTTP_MAX_RETRIES", "4")),
+            total_budget=float(os.getenv("HTTP_RETRY_BUDGET", "60")),
+            pool_size=int(os.getenv("HTTP_POOL_SIZE", "10")),
+            telemetry=shared_telemetry(),
+        )
+
+    def _backoff(self, attempt: int, retry_after: float = None):
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def get(self, url: str, params: dict = None, limiter=None, timeout=None, **kwargs) -> requests.Response:
+        deadline = time.monotonic() + self.total_budget
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+
+        log = getattr(_tracking, 'log', None)
+        attempt = 0
+        while True:
+            started = limiter.acquire(skip_window=getattr(_tracking, 'backup', False)) if limiter else None
+            sent = time.monotonic()
+            if log:
+                log.sent(sent)
+            try:
+                response = self.session.get(url, params=params, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if log:
+                    log.done(time.monotonic() - sent)
+                if self.telemetry:
+                    self.telemetry.record_request(url, None, time.monotonic() - sent, retried=attempt > 0)
+                if limiter:
+                    limiter.release(started)
+                delay = self._backoff(attempt)
+                if attempt >= self.max_retries or time.monotonic() + delay > deadline:
+                    raise
+            else:
+                if log:
+                    log.done(time.monotonic() - sent)
+                if self.telemetry:
+                    self.telemetry.record_request(url, response.status_code, time.monotonic() - sent,
+                                                  _response_bytes(response, kwargs.get('stream', False)), retried=attempt > 0)
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if limiter:
+                    limiter.release(started, response.status_code, retry_after)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                # The limiter already paces throttled calls; only add our own backoff without one
+                delay = 0 if limiter and response.status_code in THROTTLE_STATUSES else self._backoff(attempt, retry_after)
+                if attempt >= self.max_retries or time.monotonic() + delay > deadline:
+                    return response
+                response.close()
+
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+
+
+# Returns the process-wide HTTP client, configured from env settings on first use.
+def shared_client() -> HttpClient:
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = HttpClient.from_env()
+        return _shared_client
+
+
+def http_get(url: str, params: dict = None, limiter=None, **kwargs) -> requests.Response:
+    return shared_client().get(url, params=params, limiter=limiter, **kwargs)
@@ -0,0 +1,57 @@
+import re
+import json
+import codecs
+from itertools import chain
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+_SKIP_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+# Yields the elements of a top-level JSON array one at a time from an iterable of
+# byte chunks (e.g. response.iter_content()), holding only a chunk or so in memory.
+def iter_json_array(chunks):
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    started = False
+
+    # A trailing None marks the end of the input so the last element can be flushed
+    for chunk in chain(chunks, [None]):
+        final = chunk is None
+        buffer = buffer[pos:] + utf8.decode(b"" if final else chunk, final=final)
+        pos = 0
+
+        while True:
+            pos = _SKIP_WHITESPACE.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ",":
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise ValueError("Truncated JSON array")
+                # The element is cut off at the end of this chunk; wait for more
+                break
+            # A bare number not yet followed by a delimiter may continue in the next chunk
+            if not final and buffer[pos] not in "{[\"" and (end == len(buffer) or buffer[end] not in _DELIMITERS):
+                break
+            yield item
+            pos = end
+
+    raise ValueError("Truncated JSON array")
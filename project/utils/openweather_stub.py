@@ -0,0 +1,303 @@
+import os
+import json
+import math
+import time
+import zlib
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+# Recorded /weather responses bundled with the scripts
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "cities_weather_covid19", "weather_data.json")
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _distance_km(lat1: float, lon1: float, lat2: float, lon2: float):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+# Made-up IDs start at 2,000,000,000, far above any real OpenWeather city ID
+def _stable_id(text: str):
+    return 2_000_000_000 + zlib.crc32(text.encode("utf-8")) % 100_000_000
+
+
+# Request latency in seconds, drawn from a distribution given as "kind:params":
+#   fixed:0.05           always 50 ms
+#   uniform:0.01,0.2     between 10 and 200 ms
+#   exponential:0.05     mean 50 ms
+#   lognormal:0.05,0.8   median 50 ms, sigma 0.8 (a long right tail)
+# slow_share of the requests take slow_seconds instead, for a hard tail.
+class LatencyModel:
+    def __init__(self, spec: str = "fixed:0", slow_share: float = 0.0, slow_seconds: float = 1.0):
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(value) for value in params.split(",") if value]
+        if kind not in ("fixed", "uniform", "exponential", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        self.slow_share = slow_share
+        self.slow_seconds = slow_seconds
+
+    def sample(self, rng: random.Random):
+        if self.slow_share and rng.random() < self.slow_share:
+            return self.slow_seconds
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "exponential":
+            return rng.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0.0
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.params[0]), self.params[1])
+        return self.params[0] if self.params else 0.0
+
+
+# A local stand-in for the OpenWeather endpoints the fetchers use:
+#   /weather?q=City[,CC]   the recorded response for that city name; unknown names get a
+#                          recorded response under the new name (or a 404 without synthesize_unknown)
+#   /weather?lat=&lon=     the nearest recorded response, moved to the requested point
+#   /weather?id=           any response served before, or a recorded one, by its ID
+#   /group?id=1,2,...      those IDs as one list
+#   /find?lat=&lon=&cnt=   a station at the point plus the nearest recorded ones
+# Any path ending in one of these works, so OPENWEATHER_BASE_URL=http://host:port/data/2.5 does.
+#
+# Each request waits for a latency drawn from `latency`, then fails with 404, 429 or a
+# 5xx at the given rates. With quota_per_minute (or key_quotas for single keys) each
+# appid gets that many requests per one-minute window before it is answered with 429
+# and Retry-After, like a free-tier key. GET /__stats returns the counters as JSON.
+class OpenWeatherStub:
+    def __init__(self, fixtures: list, latency: LatencyModel = None, rate_404: float = 0.0, rate_429: float = 0.0,
+                 rate_5xx: float = 0.0, quota_per_minute: int = None, key_quotas: dict = None,
+                 synthesize_unknown: bool = True, seed: int = None):
+        self.fixtures = [response for response in fixtures if isinstance(response, dict) and 'coord' in response]
+        self.by_name = {}
+        for response in self.fixtures:
+            for name in (response.get('city'), response.get('name')):
+                if name:
+                    self.by_name.setdefault(name.lower(), response)
+        self.latency = latency or LatencyModel()
+        self.rate_404 = rate_404
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.quota_per_minute = quota_per_minute
+        self.key_quotas = key_quotas or {}
+        self.synthesize_unknown = synthesize_unknown
+        self.server = None
+        self._lock = threading.Lock()
+        self.reset(seed)
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_FIXTURES, **options):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), **options)
+
+    # Clears counters, quota windows and issued IDs and reseeds the random draws
+    def reset(self, seed: int = None):
+        with self._lock:
+            self._rng = random.Random(seed)
+            self._issued = {response['id']: response for response in self.fixtures if 'id' in response}
+            self._windows = {}
+            self.requests = 0
+            self.statuses = {}
+            self.endpoints = {}
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'statuses': dict(self.statuses), 'endpoints': dict(self.endpoints)}
+
+    def start(self, host: str = "127.0.0.1", port: int = 0):
+        self.server = ThreadingHTTPServer((host, port), _handler(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/data/2.5"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Returns (status, body, headers) for one request, after its simulated latency.
+    def handle(self, endpoint: str, query: dict):
+        key = query.get('appid', [''])[0]
+        with self._lock:
+            self.requests += 1
+            self.endpoints[endpoint] = self.endpoints.get(endpoint, 0) + 1
+            delay = self.latency.sample(self._rng)
+            roll = self._rng.random()
+            error_code = self._rng.choice((500, 502, 503))
+            quota_wait = self._use_quota(key)
+        time.sleep(delay)
+
+        if quota_wait is not None:
+            return self._count(429, {'cod': 429, 'message': "Your account is temporary blocked due to exceeding of requests limitation of your subscription type."},
+                               {'Retry-After': str(math.ceil(quota_wait))})
+        if roll < self.rate_404:
+            return self._count(404, {'cod': '404', 'message': 'city not found'})
+        if roll < self.rate_404 + self.rate_429:
+            return self._count(429, {'cod': 429, 'message': 'Too many requests'}, {'Retry-After': '1'})
+        if roll < self.rate_404 + self.rate_429 + self.rate_5xx:
+            return self._count(error_code, {'cod': error_code, 'message': 'Internal error'})
+
+        if endpoint == 'weather':
+            response = self._weather(query)
+        elif endpoint == 'group':
+            ids = [int(value) for value in query.get('id', [''])[0].split(',') if value.strip().isdigit()]
+            entries = [self._issued[owm_id] for owm_id in ids if owm_id in self._issued]
+            response = {'cnt': len(entries), 'list': entries}
+        elif endpoint == 'find':
+            response = self._find(query)
+        else:
+            response = {'cod': '404', 'message': 'Internal error: 404'}
+        return self._count(int(response.get('cod', 200)), response)
+
+    def _count(self, status: int, body: dict, headers: dict = None):
+        with self._lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        return status, body, headers or {}
+
+    # Seconds until the key's window resets when its quota is used up, else None
+    def _use_quota(self, key: str):
+        limit = self.key_quotas.get(key, self.quota_per_minute)
+        if not limit:
+            return None
+        now = time.monotonic()
+        window_start, used = self._windows.get(key, (now, 0))
+        if now - window_start >= 60:
+            window_start, used = now, 0
+        if used >= limit:
+            return 60 - (now - window_start)
+        self._windows[key] = (window_start, used + 1)
+        return None
+
+    def _issue(self, template: dict, name: str, lat: float, lon: float, owm_id: int):
+        response = {**template, 'id': owm_id, 'name': name, 'coord': {'lat': lat, 'lon': lon}, 'cod': 200}
+        response.pop('city', None)
+        with self._lock:
+            self._issued[owm_id] = response
+        return response
+
+    def _nearest(self, lat: float, lon: float, count: int = 1):
+        return sorted(self.fixtures, key=lambda r: _distance_km(lat, lon, r['coord']['lat'], r['coord']['lon']))[:count]
+
+    def _weather(self, query: dict):
+        if 'q' in query:
+            name = query['q'][0].split(',')[0].strip()
+            recorded = self.by_name.get(name.lower())
+            if recorded is not None:
+                return {**recorded, 'cod': 200}
+            if not self.synthesize_unknown or not self.fixtures:
+                return {'cod': '404', 'message': 'city not found'}
+            owm_id = _stable_id(name.lower())
+            template = self.fixtures[owm_id % len(self.fixtures)]
+            return self._issue(template, name, template['coord']['lat'], template['coord']['lon'], owm_id)
+        if 'id' in query:
+            owm_id = int(query['id'][0]) if query['id'][0].isdigit() else None
+            with self._lock:
+                response = self._issued.get(owm_id)
+            return {**response, 'cod': 200} if response else {'cod': '404', 'message': 'city not found'}
+        if 'lat' in query and 'lon' in query and self.fixtures:
+            try:
+                lat, lon = float(query['lat'][0]), float(query['lon'][0])
+            except ValueError:
+                return {'cod': '400', 'message': 'wrong latitude'}
+            template = self._nearest(lat, lon)[0]
+            return self._issue(template, template.get('name', ''), lat, lon, _stable_id(f"{lat:.4f},{lon:.4f}"))
+        return {'cod': '400', 'message': 'Nothing to geocode'}
+
+    def _find(self, query: dict):
+        try:
+            lat, lon = float(query['lat'][0]), float(query['lon'][0])
+        except (KeyError, ValueError):
+            return {'cod': '400', 'message': 'wrong latitude'}
+        count = int(query.get('cnt', ['10'])[0])
+        stations = [self._weather({'lat': [str(lat)], 'lon': [str(lon)]})]
+        stations += [{**response, 'cod': 200} for response in self._nearest(lat, lon, count - 1)]
+        return {'cod': '200', 'message': 'accurate', 'count': len(stations), 'list': stations}
+
+
+def _handler(stub: OpenWeatherStub):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.endswith("/__stats"):
+                status, body, headers = 200, stub.stats(), {}
+            else:
+                status, body, headers = stub.handle(url.path.rstrip("/").rsplit("/", 1)[-1], parse_qs(url.query))
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _key_quota(text: str):
+    key, _, limit = text.partition("=")
+    return key, int(limit)
+
+
+# Runs the stand-in until interrupted, e.g.
+#   python project/utils/openweather_stub.py --port 8081 --latency lognormal:0.05,0.8 --rate-429 0.01
+# then OPENWEATHER_BASE_URL=http://127.0.0.1:8081/data/2.5 python project/main.py
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenWeather stand-in with latency and failure injection")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="JSON list of recorded /weather responses")
+    parser.add_argument("--latency", default="fixed:0", help="fixed:S, uniform:LO,HI, exponential:MEAN or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--slow-share", type=float, default=0.0, help="share of requests that take --slow-seconds")
+    parser.add_argument("--slow-seconds", type=float, default=1.0)
+    parser.add_argument("--rate-404", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--quota-per-minute", type=int, help="requests per appid per minute before 429")
+    parser.add_argument("--key-quota", type=_key_quota, action="append", default=[], metavar="KEY=N", help="quota for one appid")
+    parser.add_argument("--no-synthesize", action="store_true", help="answer unknown city names with 404")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    stub = OpenWeatherStub.from_file(
+        args.fixtures,
+        latency=LatencyModel(args.latency, args.slow_share, args.slow_seconds),
+        rate_404=args.rate_404, rate_429=args.rate_429, rate_5xx=args.rate_5xx,
+        quota_per_minute=args.quota_per_minute, key_quotas=dict(args.key_quota),
+        synthesize_unknown=not args.no_synthesize, seed=args.seed,
+    )
+    base_url = stub.start(args.host, args.port)
+    print(f" OpenWeather stand-in serving {len(stub.fixtures)} recorded responses at {base_url}")
+    print(f" Set OPENWEATHER_BASE_URL={base_url}; counters at {base_url}/__stats")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f" {stub.stats()}")
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
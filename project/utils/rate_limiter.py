@@ -0,0 +1,173 @@
+import os
+import time
+import threading
+from email.utils import parsedate_to_datetime
+
+
+# Status codes that mean "slow down" rather than "this request is wrong"
+THROTTLE_STATUSES = (429, 503)
+
+# Limiters shared by every call site in the process, keyed by provider name
+_shared_limiters = {}
+_shared_lock = threading.Lock()
+
+
+# Parses a Retry-After header given either as seconds or as an HTTP date.
+def parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Classic token bucket: tokens refill at `rate` per second up to `burst`.
+# acquire() blocks until a token is available or a Retry-After pause has passed.
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def block_for(self, seconds: float):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = 0.0
+            self._blocked_until = max(self._blocked_until, now + seconds)
+
+
+# Token bucket plus AIMD (additive increase, multiplicative decrease) control of
+# both the request rate and the number of requests in flight.
+# - every fast success raises the rate by `rate_step` and the window by 1/window
+# - a 429/503 halves both and pauses the bucket for Retry-After (or one interval)
+# - a response slower than `latency_factor` x the fastest seen halves the window
+# It starts with the full window and half the maximum rate, so a run begins at the
+# configured concurrency and only backs off once the provider pushes back.
+class AdaptiveRateLimiter:
+    def __init__(self, rate: float = 5.0, min_rate: float = 0.2, max_rate: float = 10.0, rate_step: float = 0.2,
+                 concurrency: int = 10, max_concurrency: int = 10, latency_factor: float = 3.0,
+                 decrease_factor: float = 0.5, burst: float = None):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_step = rate_step
+        self.max_concurrency = max_concurrency
+        self.latency_factor = latency_factor
+        self.decrease_factor = decrease_factor
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = float(concurrency)
+        self.base_latency = None
+        self.requests = 0
+        self.throttled = 0
+        self.slow = 0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    # The window defaults to WEATHER_CONCURRENCY, the number of requests the fetchers keep
+    # in flight, and the starting rate to half of the maximum rate.
+    @classmethod
+    def from_env(cls, prefix: str = "OPENWEATHER"):
+        max_rate = float(os.getenv(f"{prefix}_MAX_RATE", "10"))
+        max_concurrency = int(os.getenv(f"{prefix}_MAX_CONCURRENCY", os.getenv("WEATHER_CONCURRENCY", "10")))
+        return cls(
+            rate=float(os.getenv(f"{prefix}_RATE", str(max_rate / 2))),
+            max_rate=max_rate,
+            concurrency=max_concurrency,
+            max_concurrency=max_concurrency,
+        )
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    # Waits for a free slot in the window and a token. Returns the start time to hand back to release().
+    # With skip_window (hedge backups) only the token is waited for; the request still counts as in flight.
+    def acquire(self, skip_window: bool = False) -> float:
+        with self._cond:
+            while not skip_window and self._in_flight >= int(self.concurrency):
+                self._cond.wait()
+            self._in_flight += 1
+        self.bucket.acquire()
+        return time.monotonic()
+
+    # Feeds the outcome of a request back into the controller and frees its slot.
+    # status_code is None when the request failed without a response.
+    def release(self, started: float, status_code: int = None, retry_after: float = None):
+        latency = time.monotonic() - started
+        with self._cond:
+            self._in_flight -= 1
+            self.requests += 1
+
+            if status_code in THROTTLE_STATUSES:
+                self.throttled += 1
+                self._decrease()
+                self.bucket.block_for(retry_after if retry_after is not None else 1 / self.bucket.rate)
+            elif status_code is not None:
+                if self.base_latency is None or latency < self.base_latency:
+                    self.base_latency = latency
+                if latency > self.latency_factor * self.base_latency:
+                    self.slow += 1
+                    self.concurrency = max(1.0, self.concurrency * self.decrease_factor)
+                else:
+                    self._increase()
+
+            self._cond.notify_all()
+
+    def _increase(self):
+        self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.rate_step))
+        self.concurrency = min(float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+
+    def _decrease(self):
+        self.bucket.set_rate(max(self.min_rate, self.bucket.rate * self.decrease_factor))
+        self.concurrency = max(1.0, self.concurrency * self.decrease_factor)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'slow': self.slow,
+                'rate': round(self.bucket.rate, 2),
+                'concurrency': int(self.concurrency),
+            }
+
+
+# Returns the process-wide limiter for a provider, creating it from env settings on first use.
+def shared_limiter(name: str = "openweather") -> AdaptiveRateLimiter:
+    with _shared_lock:
+        if name not in _shared_limiters:
+            _shared_limiters[name] = AdaptiveRateLimiter.from_env(name.upper())
+        return _shared_limiters[name]
+
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+
+# Declared dtypes for the COVID frames. Counts are nullable integers, rates are
+# float64 (they are written with 2 decimals, past float32's ~7 significant digits)
+# and the low-cardinality text columns are categoricals.
+COVID_SCHEMA = {
+    "iso_country_code": "string",
+    "continent": "category",
+    "location": "category",
+    "last_updated_date": "category",
+    "total_cases": "Int64",
+    "new_cases": "Int64",
+    "total_deaths": "Int64",
+    "new_deaths": "Int64",
+    "hosp_patients": "Int64",
+    "total_cases_per_million": "float64",
+    "total_deaths_per_million": "float64",
+}
+
+# Declared dtypes for the weather frames, covering the column names used by
+# project/utils (City, Country, ...) and by the cities_weather_covid19 scripts.
+# Temperatures come with 2 decimals at most, well within float32.
+WEATHER_SCHEMA = {
+    "City": "string",
+    "Country": "category",
+    "State": "category",
+    "Latitude": "float64",
+    "Longitude": "float64",
+    "Condition": "category",
+    "Min_Temperature": "float32",
+    "Max_Temperature": "float32",
+    "ISO3": "category",
+    "city": "string",
+    "condition": "category",
+    "weather_condition": "category",
+    "temperature_min": "float32",
+    "temperature_max": "float32",
+}
+
+NUMERIC_DTYPES = {"Int64", "float32", "float64"}
+
+
+def _to_float(values):
+    if isinstance(values, pd.Series) and values.dtype.kind in "if":
+        return values.to_numpy(dtype="float64", na_value=np.nan)
+    try:
+        return np.array(values, dtype="float64")
+    except (TypeError, ValueError):
+        # Blank strings or stray text: coerce those cells to NaN
+        return pd.to_numeric(pd.Series(values, dtype="object"), errors="coerce").to_numpy(dtype="float64")
+
+
+def _blank_to_na(values):
+    if not isinstance(values, pd.Series):
+        return pd.Series([None if isinstance(v, str) and not v.strip() else v for v in values], dtype="object")
+    series = values
+    if series.dtype.kind not in "OU" and not isinstance(series.dtype, pd.StringDtype):
+        return series
+    blank = series.astype("string").str.strip().eq("").fillna(False)
+    return series.mask(blank)
+
+
+# Converts one column (a Series or a plain list) to its declared dtype, blanks becoming missing values.
+def coerce_column(values, dtype: str):
+    if dtype in NUMERIC_DTYPES:
+        floats = pd.Series(_to_float(values))
+        if dtype == "Int64":
+            return floats.round().astype("Int64")
+        return floats.astype(dtype)
+
+    series = _blank_to_na(values)
+    if dtype == "category":
+        return series.astype("category")
+    return series.astype(dtype)
+
+
+# Applies a schema to every column it declares; other columns are left untouched.
+def apply_schema(df: pd.DataFrame, schema: dict):
+    columns = {}
+    for col in df.columns:
+        columns[col] = coerce_column(df[col].reset_index(drop=True), schema[col]) if col in schema else df[col].reset_index(drop=True)
+    typed_df = pd.DataFrame(columns)
+    typed_df.index = df.index
+    return typed_df
+
+
+# Gives two categorical key columns the same categories so a merge can join on the codes.
+def align_categories(left: pd.Series, right: pd.Series):
+    if not (isinstance(left.dtype, pd.CategoricalDtype) and isinstance(right.dtype, pd.CategoricalDtype)):
+        return left, right
+    categories = left.cat.categories.union(right.cat.categories)
+    return left.cat.set_categories(categories), right.cat.set_categories(categories)
@@ -0,0 +1,45 @@
+import math
+
+import numpy as np
+
+from .weather_batch import haversine_km
+
+
+KM_PER_DEGREE_LAT = 110.57
+KM_PER_DEGREE_LON_AT_EQUATOR = 111.32
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+# Groups cities lying within radius_km of a group representative, using a grid index:
+# cities are bucketed into radius-sized cells of a local km projection, so each city
+# only checks the representatives in its own and the 8 neighbouring cells.
+# Returns, for every city, the position of the city whose weather it should reuse
+# (its own position if it is a representative). Cities without coordinates stay alone.
+def cluster_cities(cities: list, radius_km: float):
+    lat = np.array([_to_float(city.get('latitude')) for city in cities])
+    lon = np.array([_to_float(city.get('longitude')) for city in cities])
+    x = lon * KM_PER_DEGREE_LON_AT_EQUATOR * np.cos(np.radians(lat))
+    y = lat * KM_PER_DEGREE_LAT
+
+    representative = list(range(len(cities)))
+    cells = {}
+    for pos in range(len(cities)):
+        if math.isnan(x[pos]) or math.isnan(y[pos]):
+            continue
+        cx, cy = int(x[pos] // radius_km), int(y[pos] // radius_km)
+
+        candidates = [rep for dx in (-1, 0, 1) for dy in (-1, 0, 1) for rep in cells.get((cx + dx, cy + dy), ())]
+        if candidates:
+            distances = haversine_km(lat[pos], lon[pos], lat[candidates], lon[candidates])
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= radius_km:
+                representative[pos] = candidates[nearest]
+                continue
+        cells.setdefault((cx, cy), []).append(pos)
+    return representative
@@ -0,0 +1,117 @@
+import sqlite3
+
+import pandas as pd
+
+
+# Rows written per transaction
+UPSERT_BATCH_ROWS = 50000
+
+# WAL lets readers keep working during a load; with synchronous=NORMAL a commit only
+# waits for the WAL write. Temp b-trees and a 64 MB page cache stay in memory.
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+]
+
+NATURAL_KEY = ('iso_country_code', 'city')
+
+
+def sqlite_type(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+# Python values for one column, NaN / NA / None all becoming NULL.
+def _column_values(series: pd.Series) -> list:
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _connect(db_path: str):
+    conn = sqlite3.connect(db_path, timeout=30)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+# Creates the table on first use and adds any columns the frame has gained since.
+def _ensure_table(conn, df: pd.DataFrame, table: str, key_columns: tuple, index_columns: tuple):
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table)})")}
+    if not existing:
+        columns = ", ".join(f"{_quote(column)} {sqlite_type(dtype)}" for column, dtype in df.dtypes.items())
+        conn.execute(f"CREATE TABLE {_quote(table)} ({columns})")
+    else:
+        for column, dtype in df.dtypes.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(column)} {sqlite_type(dtype)}")
+
+    key = ", ".join(_quote(column) for column in key_columns)
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote(f'ux_{table}_key')} ON {_quote(table)} ({key})")
+    for column in index_columns:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote(f'ix_{table}_{column}')} ON {_quote(table)} ({_quote(column)})")
+    conn.commit()
+
+
+# Inserts new rows and updates existing ones matched on key_columns, in batches of
+# batch_rows per transaction. A row whose values are all unchanged is not rewritten.
+# NULL key values are stored as '' so a row without a city still matches itself on
+# the next run. index_columns get a plain index for joins and lookups.
+# Rows sharing a key would overwrite each other, so they are reported with their keys and
+# only the last of them is written.
+# Returns the number of rows inserted or updated.
+def upsert_to_sqlite(df: pd.DataFrame, db_path: str, table: str, key_columns: tuple = NATURAL_KEY,
+                     index_columns: tuple = (), batch_rows: int = UPSERT_BATCH_ROWS):
+    missing = [column for column in key_columns if column not in df.columns]
+    if missing:
+        raise KeyError(f"Key columns {missing} not in the frame")
+
+    duplicated = df.duplicated(list(key_columns), keep=False)
+    if duplicated.any():
+        duplicate_keys = df.loc[duplicated, list(key_columns)].drop_duplicates()
+        print(f" {int(duplicated.sum())} rows share {len(duplicate_keys)} {'/'.join(key_columns)} keys in {table}; "
+              f"keeping the last row of each: {[tuple(key) for key in duplicate_keys.head(10).itertuples(index=False)]}"
+              f"{' ...' if len(duplicate_keys) > 10 else ''}")
+        df = df[~df.duplicated(list(key_columns), keep='last')]
+
+    columns = list(df.columns)
+    values = [_column_values(df[column]) for column in columns]
+    for column in key_columns:
+        position = columns.index(column)
+        values[position] = ['' if value is None else value for value in values[position]]
+
+    quoted = [_quote(column) for column in columns]
+    data_columns = [name for column, name in zip(columns, quoted) if column not in key_columns]
+    statement = (
+        f"INSERT INTO {_quote(table)} ({', '.join(quoted)}) VALUES ({', '.join(['?'] * len(quoted))}) "
+        f"ON CONFLICT ({', '.join(_quote(column) for column in key_columns)}) DO "
+    )
+    if data_columns:
+        statement += (
+            "UPDATE SET " + ", ".join(f"{name} = excluded.{name}" for name in data_columns)
+            + " WHERE " + " OR ".join(f"{_quote(table)}.{name} IS NOT excluded.{name}" for name in data_columns)
+        )
+    else:
+        statement += "NOTHING"
+
+    conn = _connect(db_path)
+    try:
+        _ensure_table(conn, df, table, key_columns, index_columns)
+        rows = list(zip(*values))
+        written_before = conn.total_changes
+        for start in range(0, len(rows), batch_rows):
+            with conn:
+                conn.executemany(statement, rows[start:start + batch_rows])
+        written = conn.total_changes - written_before
+    finally:
+        conn.close()
+
+    print(f" {written} of {len(df)} rows written to {table} in {db_path}, the rest unchanged.")
+    return written
@@ -0,0 +1,146 @@
+import os
+import glob
+import time
+import json
+import pickle
+import hashlib
+import inspect
+import threading
+from functools import lru_cache
+
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+# Digest of a file's bytes, e.g. a local input file that should be part of a stage key.
+# Each file is read once per process; a pipeline run is one process.
+@lru_cache(maxsize=None)
+def file_digest(path: str):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# Version of the code behind a stage function: the source of its module plus every module
+# in utils, so editing any helper a stage might call gives the stage a new key.
+def code_version(func):
+    paths = set(glob.glob(os.path.join(UTILS_DIR, "*.py")))
+    try:
+        paths.add(os.path.abspath(inspect.getsourcefile(func)))
+    except TypeError:
+        # Builtins and C functions have no source file
+        pass
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+
+# Content address of one stage output: a hash of the stage, the output name, the stage's
+# parameters, the keys of its inputs and its code version.
+def output_key(stage_name: str, output: str, params: dict, input_keys: list, version: str):
+    payload = json.dumps({
+        'stage': stage_name,
+        'output': output,
+        'params': params or {},
+        'inputs': input_keys,
+        'code': version,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Stage outputs on disk under their content key, as pickles (protocol 5 keeps DataFrames
+# with categoricals and nullable dtypes intact and loads them in milliseconds).
+# Entries are never overwritten in place: a new key gets a new file, written through a
+# temporary file and a rename, so a crashed run leaves no half-written entry.
+# Every store prunes the directory: entries not used for max_age seconds go first, then
+# the least recently used ones until the rest fit in max_bytes. A load marks its entry
+# as used.
+class StageCache:
+    def __init__(self, directory: str, enabled: bool = True, max_age: float = 7 * 86400, max_bytes: int = 1 << 30):
+        self.directory = directory
+        self.enabled = enabled
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            directory=os.getenv("STAGE_CACHE_DIR", "stage_cache"),
+            enabled=os.getenv("STAGE_CACHE", "1") == "1",
+            max_age=float(os.getenv("STAGE_CACHE_MAX_AGE", str(7 * 86400))),
+            max_bytes=int(os.getenv("STAGE_CACHE_MAX_BYTES", str(1 << 30))),
+        )
+
+    def _path(self, key: str):
+        return os.path.join(self.directory, key[:2], f"{key}.pkl")
+
+    def __contains__(self, key: str):
+        return self.enabled and os.path.exists(self._path(key))
+
+    def load(self, key: str):
+        path = self._path(key)
+        with open(path, "rb") as f:
+            value = pickle.load(f)
+        os.utime(path)
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def store(self, key: str, value):
+        with self._lock:
+            self.misses += 1
+        if not self.enabled:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(value, f, protocol=5)
+        os.replace(temp_path, path)
+        self.prune()
+
+    # Removes expired entries, then the least recently used ones past max_bytes; leftover
+    # temporary files of crashed runs expire like entries. Returns the number removed.
+    def prune(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, "*", "*")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(reverse=True)
+
+        cutoff = time.time() - self.max_age
+        kept_bytes = 0
+        removed = 0
+        for used_at, size, path in entries:
+            kept_bytes += size
+            if used_at >= cutoff and kept_bytes <= self.max_bytes:
+                continue
+            kept_bytes -= size
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+# Returns the process-wide stage cache, configured from env settings on first use.
+def shared_stage_cache() -> StageCache:
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = StageCache.from_env()
+        return _shared_cache
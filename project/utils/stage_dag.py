@@ -0,0 +1,184 @@
+import os
+import time
+import pickle
+import hashlib
+from collections import namedtuple
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .etl_logging import get_logger, flush_logging
+from .stage_cache import code_version, output_key
+
+
+# One pipeline step: func is called with the values named in inputs, in that order, and its
+# return value is stored under outputs (one name: the value itself; several: a tuple of
+# that length; none: the return value is dropped, e.g. a load step).
+# params holds whatever else decides the output (settings, a file digest, a TTL bucket)
+# and goes into the stage's cache key; with cache=True the output is kept in the stage cache.
+Stage = namedtuple('Stage', ['name', 'func', 'inputs', 'outputs', 'params', 'cache'], defaults=((), (), None, False))
+
+DEFAULT_STAGE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+
+logger = get_logger("stages")
+
+
+# Checks that every input has exactly one producer and that the stages form no cycle.
+def validate_stages(stages: list, initial: dict = None):
+    producers = {name: None for name in (initial or {})}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(f"'{output}' is produced by both {producers[output] or 'the initial values'} and {stage.name}")
+            producers[output] = stage.name
+    for stage in stages:
+        missing = [name for name in stage.inputs if name not in producers]
+        if missing:
+            raise ValueError(f"Stage {stage.name} needs {missing}, which no stage produces")
+
+    available = set(initial or {})
+    remaining = list(stages)
+    while remaining:
+        ready = [stage for stage in remaining if available.issuperset(stage.inputs)]
+        if not ready:
+            raise ValueError(f"Stages {[stage.name for stage in remaining]} depend on each other in a cycle")
+        for stage in ready:
+            available.update(stage.outputs)
+            remaining.remove(stage)
+
+
+# Longest chain of dependent stage durations: the least wall time the DAG can take.
+# Stages in independent (cache hits) wait for none of their inputs.
+def critical_path(stages: list, durations: dict, independent: set = frozenset()):
+    producer = {output: stage for stage in stages for output in stage.outputs}
+    finish = {}
+
+    def longest(stage):
+        if stage.name not in finish:
+            inputs = () if stage.name in independent else stage.inputs
+            upstream = [longest(producer[name]) for name in inputs if name in producer]
+            finish[stage.name] = durations.get(stage.name, 0.0) + max(upstream, default=0.0)
+        return finish[stage.name]
+
+    return max((longest(stage) for stage in stages), default=0.0)
+
+
+# Keys of every value, computed before anything runs: a stage's key depends only on its
+# params, its code and the keys of its inputs, so a cached output can be found without
+# producing its inputs. Initial values are keyed by their pickled bytes.
+def stage_keys(stages: list, initial: dict = None):
+    keys = {name: hashlib.sha256(pickle.dumps(value)).hexdigest() for name, value in (initial or {}).items()}
+    remaining = list(stages)
+    by_stage = {}
+    while remaining:
+        for stage in [stage for stage in remaining if all(name in keys for name in stage.inputs)]:
+            remaining.remove(stage)
+            key = output_key(stage.name, ",".join(stage.outputs), stage.params,
+                             [keys[name] for name in stage.inputs], code_version(stage.func))
+            by_stage[stage.name] = key
+            keys.update({output: output_key(stage.name, output, None, [key], "") for output in stage.outputs})
+    return by_stage
+
+
+# Stages the run needs: every stage whose outputs nothing else consumes (loads and final
+# results), plus, going upstream, the producers of inputs of every stage that is not a
+# cache hit. A stage needed only by cache hits is skipped.
+def _needed_stages(stages: list, hits: set):
+    producer = {output: stage for stage in stages for output in stage.outputs}
+    consumed = {name for stage in stages for name in stage.inputs}
+    needed = set()
+    todo = [stage for stage in stages if not consumed.intersection(stage.outputs)]
+    while todo:
+        stage = todo.pop()
+        if stage.name in needed:
+            continue
+        needed.add(stage.name)
+        if stage.name not in hits:
+            todo.extend(producer[name] for name in stage.inputs if name in producer)
+    return [stage for stage in stages if stage.name in needed]
+
+
+def _call(stage: Stage, values: dict, telemetry, cache=None, key: str = None, hit: bool = False):
+    # Out before the stage's own print() lines
+    logger.info("Stage %s %s", stage.name, "loading from cache" if hit else "started")
+    flush_logging()
+    with telemetry.stage(stage.name) if telemetry else nullcontext():
+        if hit:
+            return cache.load(key)
+        result = stage.func(*[values[name] for name in stage.inputs])
+    if key is not None:
+        cache.store(key, result)
+    return result
+
+
+def _store(stage: Stage, result, values: dict):
+    if len(stage.outputs) == 1:
+        values[stage.outputs[0]] = result
+    elif stage.outputs:
+        if not isinstance(result, tuple) or len(result) != len(stage.outputs):
+            raise ValueError(f"Stage {stage.name} should return {len(stage.outputs)} values for {list(stage.outputs)}")
+        values.update(zip(stage.outputs, result))
+
+
+# Runs the stages as soon as their inputs exist, up to max_workers at once, so the run
+# takes about as long as its critical path instead of the sum of all stages. Stages run
+# in threads: the pipeline's steps mostly wait on the network or on disk.
+# Logs each start and finish and, at the end, the wall time against the sum of stage
+# times and the critical path. With telemetry, each stage is recorded as a telemetry
+# stage (its CPU time then includes whatever ran alongside it).
+# When a stage fails, nothing new is started, the running stages are waited for and the
+# first error is raised.
+# With a StageCache, a cache=True stage whose key is already stored loads its output
+# instead of running, and the stages feeding only such hits are skipped altogether; the
+# outputs of skipped stages are then missing from the result. Every cache=True stage
+# that does run stores its output.
+# Returns the values: the initial ones and the stage outputs.
+def run_stages(stages: list, initial: dict = None, max_workers: int = DEFAULT_STAGE_WORKERS, telemetry=None, cache=None):
+    validate_stages(stages, initial)
+    values = dict(initial or {})
+    keys = {}
+    hits = set()
+    if cache is not None and cache.enabled:
+        cached = {stage.name for stage in stages if stage.cache}
+        keys = {name: key for name, key in stage_keys(stages, initial).items() if name in cached}
+        hits = {name for name, key in keys.items() if key in cache}
+        needed = _needed_stages(stages, hits)
+        hits &= {stage.name for stage in needed}
+        if hits:
+            skipped = [stage.name for stage in stages if stage not in needed]
+            logger.info("Stage cache: loading %s, skipping %s", ", ".join(sorted(hits)), ", ".join(skipped) or "nothing")
+        stages = needed
+    pending = list(stages)
+    running = {}
+    durations = {}
+    error = None
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as executor:
+        while pending or running:
+            if error is None:
+                for stage in [stage for stage in pending if stage.name in hits or all(name in values for name in stage.inputs)]:
+                    pending.remove(stage)
+                    future = executor.submit(_call, stage, values, telemetry, cache, keys.get(stage.name), stage.name in hits)
+                    running[future] = (stage, time.perf_counter())
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, stage_started = running.pop(future)
+                durations[stage.name] = time.perf_counter() - stage_started
+                try:
+                    _store(stage, future.result(), values)
+                except Exception as e:
+                    logger.error("Stage %s failed after %.2fs: %s", stage.name, durations[stage.name], e)
+                    error = error or e
+                    continue
+                logger.info("Stage %s done in %.2fs (%d/%d)", stage.name, durations[stage.name], len(durations), len(stages))
+
+    if error is None:
+        logger.info("%d stages in %.2fs wall time: %.2fs of stage time, critical path %.2fs",
+                    len(stages), time.perf_counter() - started, sum(durations.values()), critical_path(stages, durations, hits))
+    flush_logging()
+    if error is not None:
+        raise error
+    return values
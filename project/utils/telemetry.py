@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; max RSS is then left out of the report
+    resource = None
+
+
+# Upper bounds (seconds) of the HTTP latency histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_shared_telemetry = None
+_shared_lock = threading.Lock()
+
+
+def _max_rss_bytes():
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+# CPU time of this process and of finished child processes (e.g. the file writers)
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+# Collects per-stage timings and per-request HTTP numbers for one run.
+# stage() records wall time, CPU time and the process' max RSS so far for a block; with
+# trace_memory it also records the block's peak Python heap (tracemalloc, slower).
+# record_request() is fed by the HTTP client on every attempt.
+class Telemetry:
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.started_at = time.time()
+        self.stages = []
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(trace_memory=os.getenv("TELEMETRY_TRACE_MEMORY", "0") == "1")
+
+    @contextmanager
+    def stage(self, name: str):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        wall_started = time.perf_counter()
+        cpu_started = _cpu_seconds()
+        try:
+            yield
+        finally:
+            record = {
+                'stage': name,
+                'wall_seconds': round(time.perf_counter() - wall_started, 4),
+                'cpu_seconds': round(_cpu_seconds() - cpu_started, 4),
+                'max_rss_bytes': _max_rss_bytes(),
+            }
+            if self.trace_memory:
+                record['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+            with self._lock:
+                self.stages.append(record)
+
+    # status is the HTTP status code, or None when the attempt failed without a response.
+    def record_request(self, url: str, status, seconds: float, response_bytes: int = 0, retried: bool = False):
+        host = urlparse(url).hostname or "unknown"
+        with self._lock:
+            stats = self.requests.get(host)
+            if stats is None:
+                stats = self.requests[host] = {
+                    'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+                    'latency_sum': 0.0,
+                    'count': 0,
+                    'statuses': {},
+                    'bytes': 0,
+                    'retries': 0,
+                }
+            stats['buckets'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats['latency_sum'] += seconds
+            stats['count'] += 1
+            status = str(status) if status is not None else "error"
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+            stats['bytes'] += response_bytes
+            stats['retries'] += int(retried)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'duration_seconds': round(time.time() - self.started_at, 4),
+                'stages': [dict(stage) for stage in self.stages],
+                'http': {
+                    host: {
+                        'requests': stats['count'],
+                        'latency_seconds_sum': round(stats['latency_sum'], 4),
+                        'latency_buckets': {
+                            str(bound): count for bound, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], stats['buckets'])
+                        },
+                        'statuses': dict(stats['statuses']),
+                        'bytes': stats['bytes'],
+                        'retries': stats['retries'],
+                    }
+                    for host, stats in self.requests.items()
+                },
+            }
+
+    def prometheus_lines(self) -> list:
+        report = self.report()
+        lines = [
+            "# HELP etl_run_duration_seconds Wall time of the whole run.",
+            "# TYPE etl_run_duration_seconds gauge",
+            f"etl_run_duration_seconds {report['duration_seconds']}",
+            "# HELP etl_run_timestamp_seconds Unix time the run started.",
+            "# TYPE etl_run_timestamp_seconds gauge",
+            f"etl_run_timestamp_seconds {report['started_at']}",
+        ]
+
+        stage_metrics = [
+            ('wall_seconds', 'etl_stage_wall_seconds', "Wall time per pipeline stage."),
+            ('cpu_seconds', 'etl_stage_cpu_seconds', "CPU time per pipeline stage."),
+            ('max_rss_bytes', 'etl_stage_max_rss_bytes', "Process max RSS at the end of each stage."),
+            ('peak_traced_bytes', 'etl_stage_peak_traced_bytes', "Peak Python heap during each stage."),
+        ]
+        for key, metric, help_text in stage_metrics:
+            samples = [(stage['stage'], stage[key]) for stage in report['stages'] if stage.get(key) is not None]
+            if samples:
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+                lines += [f'{metric}{{stage="{_label(stage)}"}} {value}' for stage, value in samples]
+
+        if report['http']:
+            lines += [
+                "# HELP etl_http_request_duration_seconds HTTP attempt latency.",
+                "# TYPE etl_http_request_duration_seconds histogram",
+            ]
+            for host, stats in report['http'].items():
+                cumulative = 0
+                for bound, count in stats['latency_buckets'].items():
+                    cumulative += count
+                    lines.append(f'etl_http_request_duration_seconds_bucket{{host="{_label(host)}",le="{bound}"}} {cumulative}')
+                lines.append(f'etl_http_request_duration_seconds_sum{{host="{_label(host)}"}} {stats["latency_seconds_sum"]}')
+                lines.append(f'etl_http_request_duration_seconds_count{{host="{_label(host)}"}} {stats["requests"]}')
+
+            lines += ["# HELP etl_http_responses_total HTTP attempts by status.", "# TYPE etl_http_responses_total counter"]
+            for host, stats in report['http'].items():
+                lines += [f'etl_http_responses_total{{host="{_label(host)}",status="{status}"}} {count}'
+                          for status, count in stats['statuses'].items()]
+            lines += ["# HELP etl_http_response_bytes_total Response body bytes received.", "# TYPE etl_http_response_bytes_total counter"]
+            lines += [f'etl_http_response_bytes_total{{host="{_label(host)}"}} {stats["bytes"]}' for host, stats in report['http'].items()]
+            lines += ["# HELP etl_http_retries_total HTTP attempts that were retries.", "# TYPE etl_http_retries_total counter"]
+            lines += [f'etl_http_retries_total{{host="{_label(host)}"}} {stats["retries"]}' for host, stats in report['http'].items()]
+        return lines
+
+    # Writes through a temporary file and a rename, so a scraper never reads half a file.
+    def _write(self, path: str, text: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+    def write_json(self, path: str):
+        self._write(path, json.dumps(self.report(), indent=2))
+
+    # Prometheus text exposition format, e.g. for node_exporter's textfile collector.
+    def write_prometheus(self, path: str):
+        self._write(path, "\n".join(self.prometheus_lines()) + "\n")
+
+
+# Returns the process-wide telemetry collector, configured from env settings on first use.
+def shared_telemetry() -> Telemetry:
+    global _shared_telemetry
+    with _shared_lock:
+        if _shared_telemetry is None:
+            _shared_telemetry = Telemetry.from_env()
+        return _shared_telemetry
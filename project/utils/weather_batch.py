@@ -0,0 +1,106 @@
+import numpy as np
+
+
+# Largest batches OpenWeather accepts: /group takes up to 20 city IDs, /find returns up to 50 cities
+GROUP_BATCH_SIZE = 20
+FIND_MAX_COUNT = 50
+
+# A /find result counts as a city's weather only if it lies within this distance of the city
+DEFAULT_MATCH_RADIUS_KM = 10
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _ok(response: dict):
+    return isinstance(response, dict) and str(response.get('cod', 200)) == '200'
+
+
+def _as_weather(entry: dict):
+    # /group and /find list entries carry no 'cod' of their own
+    return {**entry, 'cod': 200}
+
+
+def _coords(cities: list):
+    lat = np.array([_to_float(city.get('latitude')) for city in cities])
+    lon = np.array([_to_float(city.get('longitude')) for city in cities])
+    return lat, lon
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+# Great-circle distances in km from one point to arrays of points.
+def haversine_km(lat, lon, lats, lons):
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+# Asks /group for cities whose OpenWeather ID is known (city['owm_id']), 20 IDs per request.
+# Returns {position in cities: response}.
+def fetch_group_batches(cities: list, get_json):
+    positions_by_id = {}
+    for pos, city in enumerate(cities):
+        owm_id = city.get('owm_id')
+        if owm_id is not None and not (isinstance(owm_id, float) and np.isnan(owm_id)):
+            positions_by_id.setdefault(int(owm_id), []).append(pos)
+
+    results = {}
+    ids = list(positions_by_id)
+    for start in range(0, len(ids), GROUP_BATCH_SIZE):
+        batch = ids[start:start + GROUP_BATCH_SIZE]
+        response = get_json('group', {'id': ','.join(str(owm_id) for owm_id in batch)})
+        if not _ok(response):
+            continue
+        for entry in response.get('list', []):
+            for pos in positions_by_id.get(entry.get('id'), []):
+                results[pos] = _as_weather(entry)
+    return results
+
+
+# Asks /find around one city at a time for the 50 nearest reported places and hands
+# each of those to every still-pending city within match_radius_km of it.
+# Returns {position in cities: response}.
+def fetch_circle_batches(cities: list, get_json, match_radius_km: float = DEFAULT_MATCH_RADIUS_KM):
+    lat, lon = _coords(cities)
+    pending = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+    results = {}
+
+    while len(pending):
+        center = pending[0]
+        response = get_json('find', {'lat': lat[center], 'lon': lon[center], 'cnt': FIND_MAX_COUNT})
+        stations = response.get('list', []) if _ok(response) else []
+
+        if stations:
+            station_lat = np.array([_to_float(s.get('coord', {}).get('lat')) for s in stations])
+            station_lon = np.array([_to_float(s.get('coord', {}).get('lon')) for s in stations])
+            # distances[i, j]: station i to pending city j
+            distances = np.vstack([haversine_km(slat, slon, lat[pending], lon[pending]) for slat, slon in zip(station_lat, station_lon)])
+            nearest = np.argmin(np.where(np.isnan(distances), np.inf, distances), axis=0)
+            nearest_km = distances[nearest, np.arange(len(pending))]
+            matched = nearest_km <= match_radius_km
+            for pos, station in zip(pending[matched], nearest[matched]):
+                results[pos] = _as_weather(stations[station])
+            pending = pending[~matched]
+
+        # The centre is settled either way: matched above, or left for a single request
+        pending = pending[pending != center]
+    return results
+
+
+# Resolves as many cities as possible with batched requests.
+# Returns ({position: response} for the batched cities, positions left for single requests).
+def fetch_weather_batched(cities: list, get_json, match_radius_km: float = DEFAULT_MATCH_RADIUS_KM):
+    results = fetch_group_batches(cities, get_json)
+
+    rest = [pos for pos in range(len(cities)) if pos not in results]
+    circle_results = fetch_circle_batches([cities[pos] for pos in rest], get_json, match_radius_km)
+    for sub_pos, response in circle_results.items():
+        results[rest[sub_pos]] = response
+
+    leftovers = [pos for pos in range(len(cities)) if pos not in results]
+    return results, leftovers
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+# Coordinates are rounded to this many decimals (~1 km) before being used as a key
+COORD_PRECISION = 2
+
+# Eviction runs once every this many writes rather than on every insert
+EVICT_EVERY = 100
+
+OPENWEATHER_URL = "https://api.openweathermap.org/data/2.5"
+
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def city_key(city_name: str):
+    return f"q:{city_name.strip().lower()}"
+
+
+def id_key(owm_id):
+    return f"id:{int(owm_id)}"
+
+
+def coord_key(lat, lon, precision: int = COORD_PRECISION):
+    return f"coord:{round(float(lat), precision):.{precision}f},{round(float(lon), precision):.{precision}f}"
+
+
+# Key prefix for answers from base_url. Answers from the real API keep plain keys; any other
+# server (the local stand-in, a proxy) gets keys of its own, so its made-up answers and IDs
+# never reach a run against the real API.
+def url_namespace(base_url: str):
+    base_url = base_url.rstrip("/")
+    return "" if base_url == OPENWEATHER_URL else f"{base_url}|"
+
+
+def is_cacheable(response: dict):
+    return isinstance(response, dict) and response.get('cod') == 200
+
+
+# Disk-backed TTL cache for OpenWeather responses, stored in SQLite.
+# Each thread gets its own connection; WAL mode and a busy timeout make it safe
+# to share the file between threads and between concurrently running scripts.
+# Once the table grows past max_entries the least recently fetched rows are dropped.
+# Every key is stored under namespace (see url_namespace).
+class WeatherCache:
+    def __init__(self, path: str, ttl: float = 600, max_entries: int = 100000, namespace: str = ""):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS weather_cache (
+                key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_cache_fetched_at ON weather_cache (fetched_at)")
+        conn.commit()
+
+    @classmethod
+    def from_env(cls, namespace: str = ""):
+        return cls(
+            path=os.getenv("WEATHER_CACHE_PATH", "weather_cache.db"),
+            ttl=float(os.getenv("WEATHER_CACHE_TTL", "600")),
+            max_entries=int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "100000")),
+            namespace=namespace,
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        row = self._connect().execute(
+            "SELECT payload FROM weather_cache WHERE key = ? AND fetched_at >= ?",
+            (self.namespace + key, time.time() - self.ttl),
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, response: dict):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO weather_cache (key, payload, fetched_at) VALUES (?, ?, ?)",
+            (self.namespace + key, json.dumps(response), time.time()),
+        )
+        conn.commit()
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    # Returns the cached response for key, or calls fetch() and caches its result if it is a good answer.
+    def get_or_fetch(self, key: str, fetch):
+        response = self.get(key)
+        if response is None:
+            response = fetch()
+            if is_cacheable(response):
+                self.set(key, response)
+        return response
+
+    def evict(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM weather_cache WHERE fetched_at < ?", (time.time() - self.ttl,))
+        conn.execute("""
+            DELETE FROM weather_cache WHERE key IN (
+                SELECT key FROM weather_cache ORDER BY fetched_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+        conn.commit()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+# Returns the process-wide weather cache for a namespace, configured from env settings on first use.
+def shared_cache(name: str = "openweather", namespace: str = "") -> WeatherCache:
+    with _shared_lock:
+        if (name, namespace) not in _shared_caches:
+            _shared_caches[(name, namespace)] = WeatherCache.from_env(namespace)
+        return _shared_caches[(name, namespace)]
@@ -0,0 +1,158 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from .etl_logging import get_logger
+from .http_client import ExchangeLog, track_exchanges
+
+
+DEFAULT_CONCURRENCY = 10
+
+logger = get_logger("weather_fetch")
+
+
+def is_valid_weather(response: dict):
+    return response.get('cod') == 200 and 'weather' in response
+
+
+# A definitive "no such place" (OpenWeather sends cod "404"), as opposed to throttling,
+# a server error or no answer at all, which say nothing about the city itself
+def is_not_found(response: dict):
+    return isinstance(response, dict) and str(response.get('cod')) == '404'
+
+
+# Runs the first attempt in a semaphore slot and, once it has been on the wire for longer
+# than the hedge policy's delay, the second one alongside it; time spent waiting for the
+# rate limiter does not count. Attempts are (source, func, args); returns the
+# (source, response) of the first valid answer, or the first attempt's answer when none is.
+# The backup skips the semaphore and the rate limiter's window: queued behind every
+# waiting city it would come too late, and the hedge budget already bounds the extra load. The loser is cancelled; if its
+# request is already running in a thread it is left to finish there and its answer dropped.
+async def _race(timed, semaphore: asyncio.Semaphore, attempts: list, hedge, exchanges: ExchangeLog):
+    async with semaphore:
+        race_started = time.monotonic()
+        tasks = {asyncio.ensure_future(timed(*attempts[0][1:])): 0}
+        pending = set(tasks)
+        delay = timeout = hedge.delay() if hedge else None
+        fallback = (attempts[0][0], None)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                sent = exchanges.last_sent
+                on_wire = time.monotonic() - sent if sent is not None and sent >= race_started else 0.0
+                if on_wire < delay:
+                    # Still queued for the limiter, or sent too recently
+                    timeout = delay - on_wire
+                    continue
+                # Slower than the learned percentile: send the backup if the budget allows
+                timeout = None
+                if hedge.try_hedge():
+                    task = asyncio.ensure_future(timed(*attempts[1][1:], backup=True))
+                    tasks[task] = 1
+                    pending.add(task)
+                continue
+            for task in done:
+                response = task.result()
+                if is_valid_weather(response):
+                    for other in pending:
+                        other.cancel()
+                    if tasks[task] == 1:
+                        hedge.record_win()
+                    return attempts[tasks[task]][0], response
+                if tasks[task] == 0:
+                    fallback = (attempts[0][0], response)
+        return fallback
+
+
+# Fetches one city by name and, if that misses, by coordinates.
+# With a CityIndex, a city seen before is fetched once by its location ID through the
+# path that worked last time, and a city that both lookups reported as not found is
+# skipped without a request.
+# With a HedgePolicy, a slow ID or coordinate request is hedged with a duplicate and a
+# slow by-name request with the coordinate query, whichever answers first is kept.
+# Returns (source, response) where source is 'city', 'coord' or None.
+async def _fetch_one(city: dict, fetch_by_city, fetch_by_coord, semaphore: asyncio.Semaphore, executor: ThreadPoolExecutor,
+                     index=None, fetch_by_id=None, hedge=None):
+    loop = asyncio.get_running_loop()
+    # Only the HTTP exchanges are timed, so the hedge delay follows the server's latency.
+    # Per-city latency runs from the city's first request on the wire, not from when it was
+    # queued for the semaphore or the rate limiter; cities answered from the cache have none.
+    exchanges = ExchangeLog(hedge.observe if hedge else None)
+
+    def call(func, args, backup):
+        with track_exchanges(exchanges, backup):
+            return func(*args)
+
+    async def timed(func, *args, backup=False):
+        return await loop.run_in_executor(executor, call, func, args, backup)
+
+    async def race(attempts: list):
+        return await _race(timed, semaphore, attempts, hedge, exchanges)
+
+    try:
+        return await _resolve(city, fetch_by_city, fetch_by_coord, race, index, fetch_by_id)
+    finally:
+        if hedge and exchanges.first_sent is not None:
+            hedge.observe_city(time.monotonic() - exchanges.first_sent)
+
+
+# The lookup order for one city; race() runs an attempt and its hedge.
+async def _resolve(city: dict, fetch_by_city, fetch_by_coord, race, index, fetch_by_id):
+    by_coord = ('coord', fetch_by_coord, city['latitude'], city['longitude'])
+
+    entry = index.lookup(city) if index else None
+    if entry is not None and entry.source == 'failed':
+        return None, {}
+    not_found = True
+    if entry is not None and entry.owm_id is not None and fetch_by_id is not None:
+        by_id = (entry.source, fetch_by_id, entry.owm_id)
+        source, w_data = await race([by_id, by_id])
+        if is_valid_weather(w_data):
+            return source, w_data
+
+    if entry is None or entry.source == 'city':
+        source, w_data = await race([('city', fetch_by_city, city['city']), by_coord])
+        if is_valid_weather(w_data):
+            if index:
+                index.record(city, source, w_data)
+            return source, w_data
+        not_found = is_not_found(w_data)
+        logger.debug("Skipping city: %s — Reason: %s, trying coordinates", city['city'], w_data.get('message', 'No message'))
+
+    _, w_data = await race([by_coord, by_coord])
+    if is_valid_weather(w_data):
+        if index:
+            index.record(city, 'coord', w_data)
+        return 'coord', w_data
+
+    logger.debug("Failed to get weather by coord for %s — Reason: %s", city['city'], w_data.get('message', 'No message'))
+    # Throttled or failed requests are left out of the index, so the next run asks again
+    if index and not_found and is_not_found(w_data):
+        index.record_failure(city)
+    return None, w_data
+
+
+async def _fetch_all(cities: list, fetch_by_city, fetch_by_coord, concurrency: int, index, fetch_by_id, on_result, hedge):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # Extra threads so hedged duplicates are not stuck behind the requests they back up
+    with ThreadPoolExecutor(max_workers=concurrency * 2 if hedge else concurrency) as executor:
+        async def run(city: dict):
+            source, response = await _fetch_one(city, fetch_by_city, fetch_by_coord, semaphore, executor, index, fetch_by_id, hedge)
+            if on_result:
+                on_result(city, source, response)
+            return source, response
+
+        return await asyncio.gather(*[run(city) for city in cities])
+
+
+# Runs the by-name lookups and the coordinate fallbacks for all cities concurrently,
+# at most `concurrency` requests in flight at a time.
+# on_result(city, source, response) is called as each city finishes, e.g. to checkpoint it.
+# A HedgePolicy times every request and city, and hedges slow requests when enabled.
+# Returns one (source, response) pair per city, in input order.
+def fetch_weather_results(cities: list, fetch_by_city, fetch_by_coord, concurrency: int = DEFAULT_CONCURRENCY,
+                          index=None, fetch_by_id=None, on_result=None, hedge=None):
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    return asyncio.run(_fetch_all(cities, fetch_by_city, fetch_by_coord, concurrency, index, fetch_by_id, on_result, hedge))